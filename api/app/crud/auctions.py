@@ -1,18 +1,20 @@
 """CRUD operations for auctions."""
 
+from app import inventory
 from app.crud import fixtures
 from app.schemas import request_schemas
 from fastapi import HTTPException
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from db import models
 
 
-def upsert_offer(db: Session, offer: request_schemas.Auction):
+async def upsert_offer(db: AsyncSession, offer: request_schemas.Auction):
     """Upsert an offer."""
 
-    db_fixture = fixtures.get_fixture_by_id(db, offer.fixture_id)
+    db_fixture = await fixtures.get_fixture(db, offer.fixture_id)
 
     if not db_fixture:
         raise HTTPException(status_code=404, detail="Fixture not found")
@@ -31,15 +33,13 @@ def upsert_offer(db: Session, offer: request_schemas.Auction):
         db.add(db_offer)
 
         if db_offer.group_id == 2:  # type: ignore
-            match offer.result:
-                case db_fixture.home_team.team.name:
-                    db_fixture.reserved_home -= offer.quantity  # type: ignore
-                case db_fixture.away_team.team.name:
-                    db_fixture.reserved_away -= offer.quantity  # type: ignore
-                case "---":
-                    db_fixture.reserved_draw -= offer.quantity  # type: ignore
+            column = inventory.reserved_column(db_fixture, offer.result)  # type: ignore
+            if column is not None:
+                await inventory.give(
+                    db, db_fixture.id, -offer.quantity, column  # type: ignore
+                )
 
-        db.commit()
+        await db.commit()
 
     except IntegrityError as e:
         raise HTTPException(status_code=409, detail="Offer already exists") from e
@@ -47,20 +47,21 @@ def upsert_offer(db: Session, offer: request_schemas.Auction):
     return offer
 
 
-def get_offers(db: Session):
+async def get_offers(db: AsyncSession):
     """Get all offers."""
     return (
-        db.query(models.OfferModel)
-        .filter(models.OfferModel.status == "available")
-        .filter(models.OfferModel.group_id != 2)
-        .all()
-    )
+        await db.scalars(
+            select(models.OfferModel)
+            .filter(models.OfferModel.status == "available")
+            .filter(models.OfferModel.group_id != 2)
+        )
+    ).all()
 
 
-def upsert_proposal(db: Session, proposal: request_schemas.Auction):
+async def upsert_proposal(db: AsyncSession, proposal: request_schemas.Auction):
     """Upsert a proposal."""
 
-    db_fixture = fixtures.get_fixture_by_id(db, proposal.fixture_id)
+    db_fixture = await fixtures.get_fixture(db, proposal.fixture_id)
 
     if not db_fixture:
         raise HTTPException(status_code=404, detail="Fixture not found")
@@ -80,15 +81,15 @@ def upsert_proposal(db: Session, proposal: request_schemas.Auction):
         db.add(db_proposal)
 
         if db_proposal.group_id == 2:  # type: ignore
-            match db_proposal.result:
-                case db_fixture.home_team.team.name:
-                    db_fixture.reserved_home -= proposal.quantity  # type: ignore
-                case db_fixture.away_team.team.name:
-                    db_fixture.reserved_away -= proposal.quantity  # type: ignore
-                case "---":
-                    db_fixture.reserved_draw -= proposal.quantity  # type: ignore
+            column = inventory.reserved_column(
+                db_fixture, db_proposal.result  # type: ignore
+            )
+            if column is not None:
+                await inventory.give(
+                    db, db_fixture.id, -proposal.quantity, column  # type: ignore
+                )
 
-        db.commit()
+        await db.commit()
 
     except IntegrityError as e:
         raise HTTPException(status_code=409, detail="Proposal already exists") from e
@@ -96,191 +97,181 @@ def upsert_proposal(db: Session, proposal: request_schemas.Auction):
     return proposal
 
 
-def get_proposals(db: Session):
+async def get_proposals(db: AsyncSession):
     """Get all proposals to group offers."""
 
     db_offers = (
-        db.query(models.OfferModel)
-        .filter(models.OfferModel.status == "available")
-        .filter(models.OfferModel.group_id == 2)
-        .all()
-    )
+        await db.scalars(
+            select(models.OfferModel)
+            .filter(models.OfferModel.status == "available")
+            .filter(models.OfferModel.group_id == 2)
+        )
+    ).all()
 
     auction_ids = [offer.auction_id for offer in db_offers]
 
     return (
-        db.query(models.ProposalModel)
-        .filter(models.ProposalModel.status == "pending")
-        .filter(models.ProposalModel.auction_id.in_(auction_ids))
-        .all()
-    )
+        await db.scalars(
+            select(models.ProposalModel)
+            .filter(models.ProposalModel.status == "pending")
+            .filter(models.ProposalModel.auction_id.in_(auction_ids))
+        )
+    ).all()
 
 
-def handle_acceptance(db: Session, auction: request_schemas.Auction):
+async def handle_acceptance(db: AsyncSession, auction: request_schemas.Auction):
     """Handle proposal acceptance."""
 
-    db_offer = (
-        db.query(models.OfferModel)
-        .filter(models.OfferModel.auction_id == auction.auction_id)
-        .one_or_none()
-    )
+    db_offer = await db.get(models.OfferModel, str(auction.auction_id))
 
     if db_offer is None:
         raise HTTPException(status_code=404, detail="Offer not found")
 
     if auction.group_id == 2:  # type: ignore
-        return handle_acceptance_as_proposer(db, db_offer, auction)
+        return await handle_acceptance_as_proposer(db, db_offer, auction)
 
     if db_offer.group_id == 2:  # type: ignore
-        return handle_acceptance_as_offerer(db, db_offer, auction)
+        return await handle_acceptance_as_offerer(db, db_offer, auction)
 
     proposals = (
-        db.query(models.ProposalModel)
-        .filter(models.ProposalModel.auction_id == db_offer.auction_id)
-        .all()
-    )
+        await db.scalars(
+            select(models.ProposalModel).filter(
+                models.ProposalModel.auction_id == db_offer.auction_id
+            )
+        )
+    ).all()
 
     for proposal in proposals:
         proposal.status = "accepted" if proposal.proposal_id == auction.proposal_id else "rejected"  # type: ignore
 
         if proposal.group_id == 2:  # type: ignore
-            fixture = fixtures.get_fixture_by_id(db, proposal.fixture_id)  # type: ignore
+            fixture = await fixtures.get_fixture(db, proposal.fixture_id)  # type: ignore
 
             if not fixture:
                 raise HTTPException(status_code=404, detail="Fixture not found")
 
-            match proposal.result:
-                case fixture.home_team.team.name:
-                    fixture.reserved_home += proposal.quantity  # type: ignore
-                case fixture.away_team.team.name:
-                    fixture.reserved_away += proposal.quantity  # type: ignore
-                case "---":
-                    fixture.reserved_draw += proposal.quantity  # type: ignore
+            column = inventory.reserved_column(fixture, proposal.result)  # type: ignore
+            if column is not None:
+                await inventory.give(
+                    db, fixture.id, proposal.quantity, column  # type: ignore
+                )
 
     db_offer.status = "closed"  # type: ignore
 
-    db.commit()
+    await db.commit()
 
     return auction
 
 
-def handle_acceptance_as_proposer(
-    db: Session, db_offer: models.OfferModel, auction: request_schemas.Auction
+async def handle_acceptance_as_proposer(
+    db: AsyncSession, db_offer: models.OfferModel, auction: request_schemas.Auction
 ):
     """Handle acceptance as proposer."""
 
-    offered_fixture = fixtures.get_fixture_by_id(db, db_offer.fixture_id)  # type: ignore
+    offered_fixture = await fixtures.get_fixture(db, db_offer.fixture_id)  # type: ignore
 
     if not offered_fixture:
         raise HTTPException(status_code=404, detail="Fixture not found")
 
-    match db_offer.result:
-        case offered_fixture.home_team.team.name:
-            offered_fixture.reserved_home += db_offer.quantity  # type: ignore
-        case offered_fixture.away_team.team.name:
-            offered_fixture.reserved_away += db_offer.quantity  # type: ignore
-        case "---":
-            offered_fixture.reserved_draw += db_offer.quantity  # type: ignore
+    column = inventory.reserved_column(offered_fixture, db_offer.result)  # type: ignore
+    if column is not None:
+        await inventory.give(
+            db, offered_fixture.id, db_offer.quantity, column  # type: ignore
+        )
 
     db_offer.status = "closed"  # type: ignore
 
     proposals = (
-        db.query(models.ProposalModel)
-        .filter(models.ProposalModel.auction_id == db_offer.auction_id)
-        .all()
-    )
+        await db.scalars(
+            select(models.ProposalModel).filter(
+                models.ProposalModel.auction_id == db_offer.auction_id
+            )
+        )
+    ).all()
 
     for proposal in proposals:
         proposal.status = "accepted" if proposal.proposal_id == auction.proposal_id else "rejected"  # type: ignore
 
-    db.commit()
+    await db.commit()
 
     return auction
 
 
-def handle_acceptance_as_offerer(
-    db: Session, db_offer: models.OfferModel, auction: request_schemas.Auction
+async def handle_acceptance_as_offerer(
+    db: AsyncSession, db_offer: models.OfferModel, auction: request_schemas.Auction
 ):
     """Handle acceptance as offerer."""
 
-    proposed_fixture = fixtures.get_fixture_by_id(db, auction.fixture_id)  # type: ignore
+    proposed_fixture = await fixtures.get_fixture(db, auction.fixture_id)  # type: ignore
 
     if not proposed_fixture:
         raise HTTPException(status_code=404, detail="Fixture not found")
 
-    match auction.result:
-        case proposed_fixture.home_team.team.name:
-            proposed_fixture.reserved_home += auction.quantity  # type: ignore
-        case proposed_fixture.away_team.team.name:
-            proposed_fixture.reserved_away += auction.quantity  # type: ignore
-        case "---":
-            proposed_fixture.reserved_draw += auction.quantity  # type: ignore
+    column = inventory.reserved_column(proposed_fixture, auction.result)  # type: ignore
+    if column is not None:
+        await inventory.give(
+            db, proposed_fixture.id, auction.quantity, column  # type: ignore
+        )
 
     db_offer.status = "closed"  # type: ignore
 
     db_proposals = (
-        db.query(models.ProposalModel)
-        .filter(models.ProposalModel.auction_id == db_offer.auction_id)
-        .all()
-    )
+        await db.scalars(
+            select(models.ProposalModel).filter(
+                models.ProposalModel.auction_id == db_offer.auction_id
+            )
+        )
+    ).all()
 
     for db_proposal in db_proposals:
         db_proposal.status = "accepted" if db_proposal.proposal_id == auction.proposal_id else "rejected"  # type: ignore
 
-    db.commit()
+    await db.commit()
 
     return auction
 
 
-def handle_rejection(db: Session, auction: request_schemas.Auction):
+async def handle_rejection(db: AsyncSession, auction: request_schemas.Auction):
     """Handle proposal rejection."""
 
-    db_proposal = (
-        db.query(models.ProposalModel)
-        .filter(models.ProposalModel.proposal_id == auction.proposal_id)
-        .one_or_none()
-    )
+    db_proposal = await db.get(models.ProposalModel, str(auction.proposal_id))
 
     if db_proposal is None:
         raise HTTPException(status_code=404, detail="Proposal not found")
 
     if db_proposal.group_id == 2:  # type: ignore
-        return handle_group_rejection(db, db_proposal)
+        return await handle_group_rejection(db, db_proposal)
 
     db_proposal.status = "rejected"  # type: ignore
 
-    db.commit()
+    await db.commit()
 
     return db_proposal
 
 
-def handle_group_rejection(db: Session, db_proposal: models.ProposalModel):
+async def handle_group_rejection(db: AsyncSession, db_proposal: models.ProposalModel):
     """Handle group proposal rejection."""
 
-    proposed_fixture = fixtures.get_fixture_by_id(db, db_proposal.fixture_id)  # type: ignore
+    proposed_fixture = await fixtures.get_fixture(db, db_proposal.fixture_id)  # type: ignore
 
     if not proposed_fixture:
         raise HTTPException(status_code=404, detail="Fixture not found")
 
-    match db_proposal.result:
-        case proposed_fixture.home_team.team.name:
-            proposed_fixture.reserved_home += db_proposal.quantity  # type: ignore
-        case proposed_fixture.away_team.team.name:
-            proposed_fixture.reserved_away += db_proposal.quantity  # type: ignore
-        case "---":
-            proposed_fixture.reserved_draw += db_proposal.quantity  # type: ignore
+    column = inventory.reserved_column(
+        proposed_fixture, db_proposal.result  # type: ignore
+    )
+    if column is not None:
+        await inventory.give(
+            db, proposed_fixture.id, db_proposal.quantity, column  # type: ignore
+        )
 
     db_proposal.status = "rejected"  # type: ignore
 
-    db.commit()
+    await db.commit()
 
     return db_proposal
 
 
-def get_proposal(db: Session, proposal_id: str):
+async def get_proposal(db: AsyncSession, proposal_id: str):
     """Get a proposal by ID."""
-    return (
-        db.query(models.ProposalModel)
-        .filter(models.ProposalModel.proposal_id == proposal_id)
-        .one_or_none()
-    )
+    return await db.get(models.ProposalModel, proposal_id)
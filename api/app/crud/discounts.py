@@ -1,24 +1,25 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from db import models
 
 
-def get_discount(db: Session):
-    db_discount = db.query(models.DiscountModel).one_or_none()
+async def get_discount(db: AsyncSession):
+    db_discount = (await db.execute(select(models.DiscountModel))).scalar_one_or_none()
     if db_discount is None:
         db_discount = models.DiscountModel(discount=False)
         db.add(db_discount)
-        db.commit()
+        await db.commit()
     return db_discount.discount
 
 
-def set_discount(db: Session, discount: bool):
-    db_discount = db.query(models.DiscountModel).one_or_none()
+async def set_discount(db: AsyncSession, discount: bool):
+    db_discount = (await db.execute(select(models.DiscountModel))).scalar_one_or_none()
     if db_discount is None:
         db_discount = models.DiscountModel(discount=discount)
         db.add(db_discount)
     else:
         db_discount.discount = discount
-    db.commit()
-    db.refresh(db_discount)
+    await db.commit()
+    await db.refresh(db_discount)
     return db_discount
@@ -4,30 +4,33 @@ import asyncio
 import os
 import uuid
 from datetime import datetime
+from typing import Optional
 
-import requests
+from app import http_client, inventory, request_events
 from app.crud import fixtures, users
 from app.lambda_client import invocar_generar_boleta
-from app.routers.requests import notify_clients
 from app.schemas import request_schemas
 from app.schemas.response_schemas import RequestShort
-from sqlalchemy import desc
-from sqlalchemy.orm import Session
+from fastapi import HTTPException
+from sqlalchemy import desc, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from db import models
+from db.async_database import async_session_local
 
 BET_PRICE = int(os.getenv("BET_PRICE"))
 GROUP_ID = os.getenv("GROUP_ID")
 
 
-def reserve_request(
-    db: Session,
+async def reserve_request(
+    db: AsyncSession,
     request: request_schemas.RequestShort,
     bets: str,
 ):
     """Create a request via reserved bets. (no validation needed)"""
 
-    db_fixture = fixtures.get_fixture_by_id(db, request.fixture_id)
+    db_fixture = await fixtures.get_fixture(db, request.fixture_id)
 
     if db_fixture is None:
         return None
@@ -51,33 +54,43 @@ def reserve_request(
 
     match bets:
         case "Home":
-            db_fixture.reserved_home -= request.quantity  # type: ignore
+            column = "reserved_home"
         case "Away":
-            db_fixture.reserved_away -= request.quantity  # type: ignore
+            column = "reserved_away"
         case "Draw":
-            db_fixture.reserved_draw -= request.quantity  # type: ignore
+            column = "reserved_draw"
         case _:
             return None
 
-    db.commit()
-    db.refresh(db_fixture)
+    if await inventory.take(db, request.fixture_id, request.quantity, column) is None:
+        raise HTTPException(status_code=403, detail="No more bets allowed")
+
+    await db.commit()
+    await db.refresh(db_fixture)
 
     # Notify connected clients
     print("User id in upsert is ", str(db_request.user_id))
-    db_requests = get_requests(db, str(db_request.user_id))
-    notify_clients(str(db_request.user_id), db_requests)
+    request_events.publish(db_request)
 
     return db_request
 
 
-def upsert_request(
-    db: Session,
+async def upsert_request(
+    db: AsyncSession,
     request: request_schemas.Request,
     wallet: bool = False,
 ):
-    """Create a new request."""
+    """Create a new request, or return it if it was already stored.
+
+    The broker redelivers requests and the listener replays them from its
+    spool, so the same request_id may arrive more than once.
+    """
 
-    db_fixture = fixtures.get_fixture_by_id(db, request.fixture_id)
+    existing = await db.get(models.RequestModel, str(request.request_id))
+    if existing is not None:
+        return existing
+
+    db_fixture = await fixtures.get_fixture(db, request.fixture_id)
 
     if db_fixture is None:
         return None
@@ -101,33 +114,43 @@ def upsert_request(
     )
     db.add(db_request)
 
-    db_fixture.remaining_bets -= request.quantity  # type: ignore
+    # The bets were taken by check_backend_bets with this request
 
     if request.seller == 2:
         match request.result:
             case db_fixture.home_team.team.name:
-                db_fixture.reserved_home += request.quantity  # type: ignore
+                column = "reserved_home"
             case db_fixture.away_team.team.name:
-                db_fixture.reserved_away += request.quantity  # type: ignore
+                column = "reserved_away"
             case _:
-                db_fixture.reserved_draw += request.quantity  # type: ignore
+                column = "reserved_draw"
+        await inventory.give(db, request.fixture_id, request.quantity, column)
 
-    db.commit()
-    db.refresh(db_fixture)
-    db.refresh(db_request)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Stored concurrently, the bets taken with this copy are rolled back
+        await db.rollback()
+        return await db.get(models.RequestModel, str(request.request_id))
+    await db.refresh(db_fixture)
+    await db.refresh(db_request)
 
     # Notify connected clients
     print("User id in upsert is ", str(db_request.user_id))
-    db_requests = get_requests(db, str(db_request.user_id))
-    notify_clients(str(db_request.user_id), db_requests)
+    request_events.publish(db_request)
 
     return db_request
 
 
 async def update_request(
-    db: Session, request_id: str, validation: request_schemas.RequestValidation
+    db: AsyncSession, request_id: str, validation: request_schemas.RequestValidation
 ):
-    """Update a request."""
+    """Update a request, or return it if it was already validated.
+
+    The broker redelivers validations and the listener replays them from its
+    spool, so the same validation may arrive more than once. Only the first
+    copy returns the bets and the money of a rejected request.
+    """
 
     # if type(validation.group_id) != int:
     #     try:
@@ -137,186 +160,221 @@ async def update_request(
 
     # validation.request_id = str(validation.request_id)
 
-    db_request = (
-        db.query(models.RequestModel)
-        .filter(models.RequestModel.request_id == request_id)
-        .one_or_none()
-    )
+    db_request = await get_request_by_id(db, request_id)
 
     if db_request is None:
         return None
 
+    if db_request.status != models.RequestStatusEnum.PENDING:
+        return db_request
+
+    status = (
+        models.RequestStatusEnum.APPROVED
+        if validation.valid
+        else models.RequestStatusEnum.REJECTED
+    )
+    # Conditional, so two copies handled at the same time cannot both apply
+    updated = (
+        await db.execute(
+            update(models.RequestModel)
+            .where(
+                models.RequestModel.request_id == request_id,
+                models.RequestModel.status == models.RequestStatusEnum.PENDING,
+            )
+            .values(status=status)
+        )
+    ).rowcount
+    if not updated:
+        await db.rollback()
+        await db.refresh(db_request)
+        return db_request
+
+    if not validation.valid:
+        await inventory.give(
+            db, db_request.fixture_id, db_request.quantity  # type: ignore
+        )
+
+    await db.commit()
+    await db.refresh(db_request)
+
     if validation.valid:
-        db_request.status = models.RequestStatusEnum.APPROVED  # type: ignore
-        asyncio.create_task(assign_job(db, db_request.request_id))  # type: ignore
+        asyncio.create_task(assign_job(db_request.request_id))  # type: ignore
         print("Antes de generar boleta")
-        asyncio.create_task(generate_ticket(db, db_request.request_id))  # type: ignore
+        asyncio.create_task(generate_ticket(db_request.request_id))  # type: ignore
     else:
-        db_request.status = models.RequestStatusEnum.REJECTED  # type: ignore
-        db_fixture = (
-            db.query(models.FixtureModel).filter_by(id=db_request.fixture_id).one()
-        )
-        db_fixture.remaining_bets += db_request.quantity  # type: ignore
-        asyncio.create_task(return_money(db, request_id))
-
-    db.commit()
-    db.refresh(db_request)
+        asyncio.create_task(return_money(request_id))
 
     # Notify connected clients
     print("User id in update is ", db_request.user_id)
-    requests_notify = get_requests(db, db_request.user_id)
-    notify_clients(db_request.user_id, requests_notify)
+    request_events.publish(db_request)
 
     return db_request
 
 
-async def generate_ticket(db: Session, request_id: str):
-    await asyncio.sleep(10)
-    try:
-        db_request = (
-            db.query(models.RequestModel).filter_by(request_id=request_id).one_or_none()
-        )
-        if db_request is None:
-            return None
-
-        db_user = (
-            db.query(models.UserModel).filter_by(id=db_request.user_id).one_or_none()
-        )
+# The tasks below run after the response was sent, each with its own session
 
-        if db_user is None:
-            return None
 
-        url = invocar_generar_boleta(
-            {
-                "grupo": GROUP_ID,
-                "usuario": db_user.email,
-                "equipos": db_request.fixture.home_team.team.name
-                + " vs "
-                + db_request.fixture.away_team.team.name,
-            }
-        )
-        print(url)
-        db_request.url_boleta = url
-        db.commit()
-        db.refresh(db_request)
+async def generate_ticket(request_id: str):
+    await asyncio.sleep(10)
+    try:
+        async with async_session_local() as db:
+            db_request = await get_request_by_id(db, request_id)
+            if db_request is None:
+                return None
+
+            db_user = await users.get_user(db, db_request.user_id)  # type: ignore
+
+            if db_user is None:
+                return None
+
+            db_fixture = await fixtures.get_fixture(db, db_request.fixture_id)  # type: ignore
+
+            # boto3 is blocking, keep it off the event loop
+            url = await asyncio.to_thread(
+                invocar_generar_boleta,
+                {
+                    "grupo": GROUP_ID,
+                    "usuario": db_user.email,
+                    "equipos": db_fixture.home_team.team.name
+                    + " vs "
+                    + db_fixture.away_team.team.name,
+                },
+            )
+            print(url)
+            db_request.url_boleta = url
+            await db.commit()
     except Exception as e:
         print("ERROR generando boleta", e)
 
 
-async def assign_job(db: Session, request_id: str):
+async def assign_job(request_id: str):
     """Assign a job to a user."""
     await asyncio.sleep(10)
 
-    db_request = (
-        db.query(models.RequestModel).filter_by(request_id=request_id).one_or_none()
-    )
+    async with async_session_local() as db:
+        db_request = await get_request_by_id(db, request_id)
 
-    if db_request is None:
-        return None
+        if db_request is None:
+            return None
 
-    db_user = db.query(models.UserModel).filter_by(id=db_request.user_id).one_or_none()
+        db_user = await users.get_user(db, db_request.user_id)  # type: ignore
 
-    if db_user is None:
-        return None
+        if db_user is None:
+            return None
 
-    url = "http://arquisis-jobs-master:7998/job"
-    headers = {"Content-Type": "application/json"}
-    user = {"user_id": db_user.id}
-    job_id = requests.post(url, headers=headers, json=user).json()
-    db_user.job_id = job_id["job_id"]  # type: ignore
+        user = {"user_id": db_user.id}
+        response = await http_client.jobs_master().post("/job", json=user)
+        job_id = response.json()
+        db_user.job_id = job_id["job_id"]  # type: ignore
 
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+        await db.commit()
+        return db_user
 
 
-async def return_money(db: Session, request_id: str):
+async def return_money(request_id: str):
     """Return money for a rejected request."""
     await asyncio.sleep(5)
-    db_request = (
-        db.query(models.RequestModel)
-        .filter(models.RequestModel.request_id == request_id)
-        .one_or_none()
-    )
-    if db_request is None:
-        return None
+    async with async_session_local() as db:
+        db_request = await get_request_by_id(db, request_id)
+        if db_request is None:
+            return None
 
-    db_user = db.query(models.UserModel).filter_by(id=db_request.user_id).one_or_none()
-    if db_user is None:
-        return None
+        db_user = await users.get_user(db, db_request.user_id)  # type: ignore
+        if db_user is None:
+            return None
 
-    users.update_balance(db, db_user.id, db_request.quantity * BET_PRICE, add=True)  # type: ignore
+        await users.update_balance(
+            db,
+            db_user.id,  # type: ignore
+            db_request.quantity * BET_PRICE,  # type: ignore
+            reason="refund",
+            fixture_id=db_request.fixture_id,  # type: ignore
+            request_id=db_request.request_id,  # type: ignore
+        )
 
-    db.commit()
-    db.refresh(db_request)
-    db.refresh(db_user)
-    return db_request
+        return db_request
 
 
-async def link_request(db: Session, link: request_schemas.Link):
+async def link_request(link: request_schemas.Link):
     """Link a request to a user."""
     await asyncio.sleep(5)
-    db_request = (
-        db.query(models.RequestModel)
-        .filter(models.RequestModel.request_id == link.request_id)
-        .one_or_none()
-    )
-    if db_request is None:
-        return None
+    async with async_session_local() as db:
+        db_request = await get_request_by_id(db, str(link.request_id))
+        if db_request is None:
+            return None
 
-    db_user = db.query(models.UserModel).filter_by(id=link.uid).one_or_none()
-    if db_user is None:
-        return None
+        db_user = await users.get_user(db, link.uid)
+        if db_user is None:
+            return None
 
-    db_request.user = db_user
-    db_request.location = link.location  # type: ignore
+        db_request.user_id = db_user.id
+        db_request.location = link.location  # type: ignore
 
-    db.commit()
-    db.refresh(db_request)
+        await db.commit()
 
-    # Notify connected clients
-    print("User id in link is ", db_request.user_id)
-    requests_notify = get_requests(db, db_request.user_id)
-    notify_clients(db_request.user_id, requests_notify)
+        # Notify connected clients
+        print("User id in link is ", db_request.user_id)
+        request_events.publish(db_request)
 
-    return db_request
+        return db_request
 
 
-def get_requests(db: Session, user_id: str):
-    """Get requests by user ID, sorted by datetime."""
+async def get_requests(
+    db: AsyncSession, user_id: str, before: Optional[str] = None, count: int = 25
+):
+    """Get requests by user ID, newest first.
+
+    Pages are keyed by request: pass the last request_id of a page as
+    ``before`` to get the next one.
+    """
+    order = (models.RequestModel.datetime, models.RequestModel.request_id)
+    query = select(models.RequestModel).filter_by(user_id=user_id)
+    if before is not None:
+        cursor = (
+            await db.execute(
+                select(*order).where(models.RequestModel.request_id == before)
+            )
+        ).one_or_none()
+        if cursor is None:
+            return []
+        query = query.where(tuple_(*order) < tuple(cursor))
+
     requests = (
-        db.query(models.RequestModel)
-        .filter_by(user_id=user_id)
-        .order_by(desc(models.RequestModel.datetime))
-        .all()
-    )
+        await db.scalars(query.order_by(*map(desc, order)).limit(count))
+    ).all()
     return [RequestShort.model_validate(request) for request in requests]
 
 
-def create_transaction(db: Session, transaction: request_schemas.RequestShort):
+async def create_transaction(
+    db: AsyncSession, transaction: request_schemas.RequestShort
+):
     """Create a new transaction."""
     db_transaction = models.TransactionModel(
-        request_id=uuid.uuid4(),
+        request_id=str(uuid.uuid4()),
         fixture_id=transaction.fixture_id,
         user_id=transaction.uid,
         quantity=transaction.quantity,
         result=transaction.result,
     )
     db.add(db_transaction)
-    db.commit()
-    db.refresh(db_transaction)
+    await db.commit()
+    await db.refresh(db_transaction)
     return db_transaction
 
 
-def get_transaction(db: Session, token: str):
+async def get_transaction(db: AsyncSession, token: str):
     """Get transactions by user ID."""
-    return db.query(models.TransactionModel).filter_by(token=token).one_or_none()
+    return (
+        await db.execute(select(models.TransactionModel).filter_by(token=token))
+    ).scalar_one_or_none()
 
 
-def get_request_by_id(db: Session, request_id: str):
+async def get_request_by_id(db: AsyncSession, request_id: str):
     """Get request details by request ID."""
     return (
-        db.query(models.RequestModel)
-        .filter(models.RequestModel.request_id == request_id)
-        .one_or_none()
-    )
+        await db.execute(
+            select(models.RequestModel).where(
+                models.RequestModel.request_id == request_id
+            )
+        )
+    ).scalar_one_or_none()
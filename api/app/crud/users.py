@@ -1,16 +1,19 @@
 """CRUD operations for users."""
 
+from typing import Optional
+
 from app.schemas import request_schemas
+from sqlalchemy import func, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy.sql import func
 
 from db import models
 
 
-def create_user(db: Session, user: request_schemas.User):
+async def create_user(db: AsyncSession, user: request_schemas.User):
     """Create a new user."""
     # Check if user already exists
-    db_user = db.query(models.UserModel).filter_by(id=user.uid).one_or_none()
+    db_user = await db.get(models.UserModel, user.uid)
 
     if db_user:
         return db_user
@@ -21,41 +24,162 @@ def create_user(db: Session, user: request_schemas.User):
         admin=user.admin,
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 
-def get_user(db: Session, user_id: str):
+async def get_user(db: AsyncSession, user_id: str):
     """Get user details by user ID."""
-    return db.query(models.UserModel).filter_by(id=user_id).one_or_none()
+    return await db.get(models.UserModel, user_id)
+
+
+async def update_balance(
+    db: AsyncSession,
+    user_id: str,
+    amount: float,
+    add: bool = True,
+    reason: str = "deposit",
+    fixture_id: Optional[int] = None,
+    request_id: Optional[str] = None,
+    commit: bool = True,
+):
+    """Update user wallet and record the change in the ledger.
 
+    The wallet is changed with one UPDATE, a debit only applies while the
+    wallet covers it. Returns None when the user does not exist or cannot pay.
+    With ``commit=False`` the change is left to the caller's transaction.
+    """
+    delta = amount if add else -amount
+    condition = [models.UserModel.id == user_id]
+    if not add:
+        condition.append(models.UserModel.wallet >= amount)
 
-def update_balance(db: Session, user_id: str, amount: float, add: bool = True):
-    """Update user wallet."""
-    db_user = db.query(models.UserModel).filter_by(id=user_id).one_or_none()
+    db_user = (
+        await db.scalars(
+            update(models.UserModel)
+            .where(*condition)
+            .values(wallet=models.UserModel.wallet + delta)
+            .returning(models.UserModel)
+            .execution_options(populate_existing=True)
+        )
+    ).one_or_none()
     if db_user is None:
         return None
-    if add:
-        db_user.wallet += amount  # type: ignore
-    else:
-        db_user.wallet -= amount  # type: ignore
-    db.commit()
-    db.refresh(db_user)
+
+    db.add(
+        models.WalletLedgerModel(
+            user_id=user_id,
+            delta=delta,
+            reason=reason,
+            fixture_id=fixture_id,
+            request_id=request_id,
+        )
+    )
+    if commit:
+        await db.commit()
     return db_user
 
 
-def get_current_user(db: Session, user_id: str):
-    return (
-        db.query(models.UserModel).filter(models.UserModel.id == user_id).one_or_none()
+def bulk_credit(db: Session, credits, reason: str, fixture_id: int) -> int:
+    """Credit many users at once, without committing.
+
+    ``credits`` is a subquery with ``user_id`` and ``amount`` columns, one row
+    per user. Its rows are written to the ledger and the wallets are updated
+    from them, two statements however many users there are. Each fixture must
+    be credited once per reason. Returns how many users were credited.
+    """
+    db.execute(
+        insert(models.WalletLedgerModel).from_select(
+            ["user_id", "delta", "reason", "fixture_id"],
+            select(
+                credits.c.user_id,
+                credits.c.amount,
+                literal(reason),
+                literal(fixture_id),
+            ),
+        )
+    )
+
+    entries = (
+        models.WalletLedgerModel.fixture_id == fixture_id,
+        models.WalletLedgerModel.reason == reason,
+    )
+    credited = (
+        select(func.sum(models.WalletLedgerModel.delta))
+        .where(*entries, models.WalletLedgerModel.user_id == models.UserModel.id)
+        .scalar_subquery()
+    )
+    return db.execute(
+        update(models.UserModel)
+        .where(
+            models.UserModel.id.in_(
+                select(models.WalletLedgerModel.user_id).where(*entries)
+            )
+        )
+        .values(wallet=models.UserModel.wallet + credited)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+async def get_wallet_history(
+    db: AsyncSession, user_id: str, before: Optional[int] = None, count: int = 25
+):
+    """Get the wallet changes of a user, newest first, with the balance after each.
+
+    Pages are keyed by ledger id: pass the last id of a page as ``before`` to
+    get the next one. Balances are computed back from the current wallet, so
+    they hold for wallets funded before the ledger existed too.
+    """
+    wallet = func.coalesce(models.UserModel.wallet, 0)
+    balance = select(wallet).where(models.UserModel.id == user_id)
+    if before is not None:
+        # Undo the changes of the pages already returned
+        newer = select(
+            func.coalesce(func.sum(models.WalletLedgerModel.delta), 0)
+        ).where(
+            models.WalletLedgerModel.user_id == user_id,
+            models.WalletLedgerModel.id >= before,
+        )
+        balance = balance.with_only_columns(wallet - newer.scalar_subquery())
+
+    balance = (await db.execute(balance)).scalar_one_or_none()
+    if balance is None:
+        return None
+
+    query = select(models.WalletLedgerModel).where(
+        models.WalletLedgerModel.user_id == user_id
     )
+    if before is not None:
+        query = query.where(models.WalletLedgerModel.id < before)
+    entries = (
+        await db.scalars(query.order_by(models.WalletLedgerModel.id.desc()).limit(count))
+    ).all()
 
+    history = []
+    for entry in entries:
+        history.append((entry, balance))
+        balance -= entry.delta
+    return history
 
-def delete_user(db: Session, user_id: str):
-    """Delete a user."""
-    db_user = db.query(models.UserModel).filter_by(id=user_id).one_or_none()
+
+async def get_current_user(db: AsyncSession, user_id: str):
+    return (
+        await db.execute(select(models.UserModel).where(models.UserModel.id == user_id))
+    ).scalar_one_or_none()
+
+
+async def delete_user(db: AsyncSession, user_id: str):
+    """Delete a user, keeping its wallet ledger rows without the user_id."""
+    db_user = await db.get(models.UserModel, user_id)
     if db_user is None:
         return None
-    db.delete(db_user)
-    db.commit()
+    # ON DELETE SET NULL does the same on Postgres, SQLite does not enforce it
+    await db.execute(
+        update(models.WalletLedgerModel)
+        .where(models.WalletLedgerModel.user_id == user_id)
+        .values(user_id=None)
+    )
+    await db.delete(db_user)
+    await db.commit()
     return db_user
@@ -1,14 +1,24 @@
 import os
 
+from app import inventory
 from app.crud import discounts, fixtures, users
 from app.schemas import request_schemas
 from fastapi import Depends, HTTPException, Request
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.database import get_db
+from db import models
+from db.async_database import get_async_db
 
 POST_TOKEN = os.getenv("POST_TOKEN")
 BET_PRICE = os.getenv("BET_PRICE")
+GROUP_ID = os.getenv("GROUP_ID")
+
+# Bets of a reserved purchase, by the counter they are taken from
+RESERVED_BETS = {
+    "reserved_home": "Home",
+    "reserved_away": "Away",
+    "reserved_draw": "Draw",
+}
 
 
 def verify_post_token(request: Request):
@@ -37,79 +47,85 @@ def get_location(request: Request) -> str:
     return "TODO"
 
 
-def check_balance(request: request_schemas.RequestShort):
-    """Check the balance of the user."""
-    db: Session = next(get_db())
-    user = users.get_user(db, request.uid)
-    if user:
-        if user.wallet < request.quantity * int(BET_PRICE):  # type: ignore
-            raise HTTPException(status_code=403, detail="Insufficient funds")
+async def pay(db: AsyncSession, request: request_schemas.RequestShort, amount: float):
+    """Debit a purchase from the wallet, refusing it when the funds do not cover it.
+
+    The debit is committed by the endpoint, together with the purchase.
+    """
+    paid = await users.update_balance(
+        db,
+        request.uid,
+        amount,
+        add=False,
+        reason="purchase",
+        fixture_id=request.fixture_id,
+        commit=False,
+    )
+    # Unknown users are left to the endpoint
+    if paid is None and await users.get_user(db, request.uid) is not None:
+        raise HTTPException(status_code=403, detail="Insufficient funds")
+
+
+async def check_balance(
+    request: request_schemas.RequestShort, db: AsyncSession = Depends(get_async_db)
+):
+    """Check the balance of the user and debit the purchase."""
+    await pay(db, request, request.quantity * int(BET_PRICE))  # type: ignore
+
+
+async def check_discounted_balance(
+    request: request_schemas.RequestShort, db: AsyncSession = Depends(get_async_db)
+):
+    """Check the balance of the user and debit the purchase, with the discount."""
+    discount = await discounts.get_discount(db)
+    multiplier = 0.9 if discount else 1
 
-        users.update_balance(
-            db,
-            user.id,  # type: ignore
-            request.quantity * int(BET_PRICE),  # type: ignore
-            add=False,
-        )
+    await pay(db, request, request.quantity * int(BET_PRICE) * multiplier)  # type: ignore
 
 
-def check_discounted_balance(request: request_schemas.RequestShort):
-    """Check the balance of the user."""
-    db: Session = next(get_db())
-    user = users.get_user(db, request.uid)
-    discount = discounts.get_discount(db)
-    multiplier = 0.9 if discount else 1
+async def take_bets(db: AsyncSession, fixture_id: int, quantity: int):
+    """Take bets from a fixture in the request's transaction or refuse the purchase."""
+    if await inventory.take(db, fixture_id, quantity) is None:
+        if await db.get(models.FixtureModel, fixture_id) is None:
+            raise HTTPException(status_code=404, detail="Fixture not found")
+        raise HTTPException(status_code=403, detail="No more bets allowed")
 
-    if user:
-        if user.wallet < request.quantity * int(BET_PRICE) * multiplier:  # type: ignore
-            raise HTTPException(status_code=403, detail="Insufficient funds")
 
-        users.update_balance(
-            db,
-            user.id,  # type: ignore
-            request.quantity * int(BET_PRICE) * multiplier,  # type: ignore
-            add=False,
-        )
+async def check_bets(
+    request: request_schemas.RequestShort, db: AsyncSession = Depends(get_async_db)
+):
+    """Take the bets of a purchase, committed by the endpoint with the purchase."""
+    await take_bets(db, request.fixture_id, request.quantity)
 
 
-def check_bets(request: request_schemas.RequestShort):
-    """Check the number of bets."""
-    db: Session = next(get_db())
-    fixture = fixtures.get_fixture_by_id(db, request.fixture_id)
-    if fixture:
-        if fixture.remaining_bets < request.quantity:  # type: ignore
-            raise HTTPException(status_code=403, detail="No more bets allowed")
+async def check_reserved_bets(
+    request: request_schemas.RequestShort, db: AsyncSession = Depends(get_async_db)
+):
+    """Check the number of reserved bets."""
+    db_fixture = await fixtures.get_fixture(db, request.fixture_id)
+    column = None
+    if db_fixture is not None:
+        column = inventory.reserved_column(db_fixture, request.result)
+    if column is None:
+        raise HTTPException(status_code=404, detail="Fixture not found")
 
+    if await inventory.get(db, db_fixture, column) < request.quantity:
+        raise HTTPException(status_code=403, detail="No more bets allowed")
+    return RESERVED_BETS[column]
 
-def check_reserved_bets(request: request_schemas.RequestShort):
-    """Check the number of reserved bets."""
-    db: Session = next(get_db())
-    db_fixture = fixtures.get_fixture_by_id(db, request.fixture_id)
-    if db_fixture:
-        match request.result:
-            case db_fixture.home_team.team.name:
-                if db_fixture.reserved_home < request.quantity:  # type: ignore
-                    raise HTTPException(status_code=403, detail="No more bets allowed")
-                return "Home"
-            case db_fixture.away_team.team.name:
-                if db_fixture.reserved_away < request.quantity:  # type: ignore
-                    raise HTTPException(status_code=403, detail="No more bets allowed")
-                return "Away"
-            case "---":
-                if db_fixture.reserved_draw < request.quantity:  # type: ignore
-                    raise HTTPException(status_code=403, detail="No more bets allowed")
-                return "Draw"
-
-    raise HTTPException(status_code=404, detail="Fixture not found")
-
-
-def check_backend_bets(request: request_schemas.Request):
-    """Check the number of bets."""
-    db: Session = next(get_db())
-    fixture = fixtures.get_fixture_by_id(db, request.fixture_id)
-    if fixture:
-        if fixture.remaining_bets < request.quantity:  # type: ignore
-            raise HTTPException(status_code=403, detail="No more bets allowed")
+
+async def check_backend_bets(
+    request: request_schemas.Request, db: AsyncSession = Depends(get_async_db)
+):
+    """Take the bets of a request published by the broker.
+
+    Our own requests took their bets when they were bought, and a request
+    delivered again took them the first time.
+    """
+    if str(request.group_id) == str(GROUP_ID):
+        return
+    if await db.get(models.RequestModel, str(request.request_id)) is None:
+        await take_bets(db, request.fixture_id, request.quantity)
 
 
 def get_deposit_token(request: Request) -> str:
@@ -120,8 +136,8 @@ def get_deposit_token(request: Request) -> str:
     return token
 
 
-def verify_admin(user_id: str, db: Session = Depends(get_db)):
-    user = users.get_current_user(db, user_id)
+async def verify_admin(user_id: str, db: AsyncSession = Depends(get_async_db)):
+    user = await users.get_current_user(db, user_id)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     if not user.admin:
@@ -0,0 +1,87 @@
+"""Pooled HTTP clients for the services the API calls.
+
+One ``httpx.AsyncClient`` per destination is opened in the FastAPI lifespan
+and shared by every request, so connections are kept alive between calls and
+outbound calls never block the event loop. Each destination has its own
+timeout and connection limit, a slow jobs master cannot use up the connections
+the publisher needs.
+"""
+
+import os
+
+import httpx
+
+PUBLISHER_HOST = os.getenv("PUBLISHER_HOST")
+PUBLISHER_PORT = os.getenv("PUBLISHER_PORT")
+POST_TOKEN = os.getenv("POST_TOKEN")
+
+JOBS_MASTER_HOST = os.getenv("JOBS_MASTER_HOST", "arquisis-jobs-master")
+JOBS_MASTER_PORT = os.getenv("JOBS_MASTER_PORT", "7998")
+
+# Seconds to wait for the publisher, which only queues the message
+PUBLISHER_TIMEOUT = float(os.getenv("PUBLISHER_TIMEOUT", "10"))
+PUBLISHER_MAX_CONNECTIONS = int(os.getenv("PUBLISHER_MAX_CONNECTIONS", "20"))
+
+# Seconds to wait for the jobs master
+JOBS_MASTER_TIMEOUT = float(os.getenv("JOBS_MASTER_TIMEOUT", "30"))
+JOBS_MASTER_MAX_CONNECTIONS = int(os.getenv("JOBS_MASTER_MAX_CONNECTIONS", "10"))
+
+# Seconds to wait for a new connection to any destination
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+
+clients: dict = {}
+
+
+def create_client(
+    base_url: str, timeout: float, max_connections: int, headers: dict
+) -> httpx.AsyncClient:
+    """Client with keep-alive pooling for one destination."""
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        timeout=httpx.Timeout(timeout, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        ),
+    )
+
+
+def start():
+    """Open the clients, called when the application starts."""
+    clients["publisher"] = create_client(
+        f"http://{PUBLISHER_HOST}:{PUBLISHER_PORT}",
+        PUBLISHER_TIMEOUT,
+        PUBLISHER_MAX_CONNECTIONS,
+        {"Authorization": f"Bearer {POST_TOKEN}"},
+    )
+    clients["jobs_master"] = create_client(
+        f"http://{JOBS_MASTER_HOST}:{JOBS_MASTER_PORT}",
+        JOBS_MASTER_TIMEOUT,
+        JOBS_MASTER_MAX_CONNECTIONS,
+        {"Content-Type": "application/json"},
+    )
+
+
+async def close():
+    """Close the clients and their connections, called on shutdown."""
+    while clients:
+        _, client = clients.popitem()
+        await client.aclose()
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    try:
+        return clients[name]
+    except KeyError:
+        raise RuntimeError(f"HTTP client {name} is not open") from None
+
+
+def publisher() -> httpx.AsyncClient:
+    """Client of the publisher."""
+    return get_client("publisher")
+
+
+def jobs_master() -> httpx.AsyncClient:
+    """Client of the jobs master."""
+    return get_client("jobs_master")
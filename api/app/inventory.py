@@ -0,0 +1,439 @@
+"""Bet inventory of the fixtures, optionally kept in Redis.
+
+``remaining_bets`` and the ``reserved_*`` counters of a fixture change on every
+purchase and auction. By default they are changed with UPDATEs on the caller's
+session (``fixtures.take_bets`` and ``fixtures.return_bets``), so a popular
+fixture serializes every purchase on its row lock.
+
+With ``INVENTORY_REDIS_URL`` set the counters live in a Redis hash per fixture
+and are changed with a Lua script, atomically and without touching Postgres.
+Each change is also added to a per fixture delta hash, and a flusher task in
+every API replica writes the deltas back to Postgres in batches with relative
+UPDATEs. Until then the ``fixtures`` table lags behind by at most
+``INVENTORY_FLUSH_INTERVAL`` seconds.
+
+Counters are loaded from Postgres on startup and, for fixtures created later,
+on first use. A fixture already in Redis is never overwritten, since its
+pending deltas may not be flushed yet.
+
+A change follows the caller's transaction: it is recorded in the session and
+reverted in Redis if the transaction ends without committing.
+
+The flusher moves the deltas it takes into a claim under a random token, and
+commits the token to ``inventory_flushes`` with the UPDATEs. A claim older
+than ``INVENTORY_FLUSH_TIMEOUT`` belongs to a replica that died or hung
+mid-flush: ``recover`` inserts its token first, and puts the deltas back
+only when that insert succeeds, so a late commit of the same batch fails
+instead of writing it twice. Claims are recovered and pending deltas
+flushed on startup, before the open fixtures are loaded.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.crud import fixtures
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+from sqlalchemy import bindparam, delete, event, insert, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from db import models
+from db.async_database import async_session_local
+
+INVENTORY_REDIS_URL = os.getenv("INVENTORY_REDIS_URL")
+
+# Seconds between writes of the deltas to Postgres
+INVENTORY_FLUSH_INTERVAL = float(os.getenv("INVENTORY_FLUSH_INTERVAL", "1"))
+
+# Fixtures written to Postgres per flush
+INVENTORY_FLUSH_BATCH = int(os.getenv("INVENTORY_FLUSH_BATCH", "500"))
+
+# Seconds after which a flush that was not written is recovered
+INVENTORY_FLUSH_TIMEOUT = float(os.getenv("INVENTORY_FLUSH_TIMEOUT", "60"))
+
+# Seconds the tokens of written flushes are kept in Postgres
+FLUSH_TOKENS_TTL = 24 * 3600
+
+COUNTERS = ("remaining_bets", "reserved_home", "reserved_away", "reserved_draw")
+
+COUNTERS_KEY = "inventory:{}"
+DELTAS_KEY = "inventory:deltas:{}"
+DIRTY_KEY = "inventory:dirty"
+CLAIMS_KEY = "inventory:flushing"
+CLAIM_KEY = "inventory:flushing:{}"
+
+# KEYS: counters, deltas, dirty set. ARGV: column, delta, fixture id and "1"
+# when the counter cannot go below zero. Returns {0} for an unknown fixture,
+# {1, value} when applied and {2, value} when refused.
+CHANGE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {0}
+end
+local delta = tonumber(ARGV[2])
+local value = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+if ARGV[4] == '1' and value + delta < 0 then
+    return {2, value}
+end
+value = redis.call('HINCRBY', KEYS[1], ARGV[1], delta)
+redis.call('HINCRBY', KEYS[2], ARGV[1], delta)
+redis.call('SADD', KEYS[3], ARGV[3])
+return {1, value}
+"""
+
+# KEYS: counters. ARGV: column, value pairs. Never overwrites a loaded fixture.
+LOAD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV))
+return 1
+"""
+
+# KEYS: dirty set, claims sorted set, claim. ARGV: batch size, deltas key
+# prefix, token, time. Moves a batch of dirty fixtures and their deltas to the
+# claim of the token, returned as id, {column, delta, ...} pairs.
+TAKE_DELTAS_SCRIPT = """
+local ids = redis.call('SPOP', KEYS[1], ARGV[1])
+local batch = {}
+for _, id in ipairs(ids) do
+    local key = ARGV[2] .. id
+    local fields = redis.call('HGETALL', key)
+    for i = 1, #fields, 2 do
+        redis.call('HSET', KEYS[3], id .. ':' .. fields[i], fields[i + 1])
+    end
+    table.insert(batch, id)
+    table.insert(batch, fields)
+    redis.call('DEL', key)
+end
+if #ids > 0 then
+    redis.call('ZADD', KEYS[2], ARGV[4], ARGV[3])
+end
+return batch
+"""
+
+# KEYS: dirty set, claims sorted set, claim. ARGV: deltas key prefix, token.
+# Puts the deltas of a claim back, a claim already settled is left alone.
+RESTORE_SCRIPT = """
+local fields = redis.call('HGETALL', KEYS[3])
+for i = 1, #fields, 2 do
+    local id, column = string.match(fields[i], '^(%d+):(.+)$')
+    redis.call('HINCRBY', ARGV[1] .. id, column, fields[i + 1])
+    redis.call('SADD', KEYS[1], id)
+end
+redis.call('DEL', KEYS[3])
+redis.call('ZREM', KEYS[2], ARGV[2])
+return #fields / 2
+"""
+
+client = None
+change_script = None
+load_script = None
+take_deltas_script = None
+restore_script = None
+loop: asyncio.AbstractEventLoop | None = None
+flusher: asyncio.Task | None = None
+
+
+def enabled() -> bool:
+    """Whether the counters are kept in Redis."""
+    return client is not None
+
+
+@event.listens_for(Session, "after_commit")
+def keep_changes(session: Session):
+    """Committed changes stay in Redis."""
+    session.info.pop("inventory", None)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def revert_changes(session: Session, transaction):
+    """Revert the changes of a transaction that ended without committing."""
+    if transaction.parent is not None:
+        return
+    changes = session.info.pop("inventory", None)
+    if changes and loop is not None:
+        asyncio.run_coroutine_threadsafe(revert(changes), loop)
+
+
+async def revert(changes: list):
+    """Apply recorded changes in reverse."""
+    for fixture_id, column, delta in reversed(changes):
+        await change(fixture_id, column, -delta)
+
+
+async def load(db: AsyncSession, fixture_ids: list) -> set:
+    """Load the counters of fixtures missing from Redis, returning the ones found."""
+    rows = (
+        await db.execute(
+            select(
+                models.FixtureModel.id,
+                *(getattr(models.FixtureModel, column) for column in COUNTERS),
+            ).where(models.FixtureModel.id.in_(fixture_ids))
+        )
+    ).all()
+
+    async with client.pipeline(transaction=False) as pipe:
+        for fixture_id, *values in rows:
+            args = []
+            for column, value in zip(COUNTERS, values):
+                args += [column, value or 0]
+            await load_script(
+                keys=[COUNTERS_KEY.format(fixture_id)], args=args, client=pipe
+            )
+        await pipe.execute()
+
+    return {row[0] for row in rows}
+
+
+async def change(fixture_id: int, column: str, delta: int, floor: bool = False):
+    """Run the change script, returning its status and the new value."""
+    result = await change_script(
+        keys=[
+            COUNTERS_KEY.format(fixture_id),
+            DELTAS_KEY.format(fixture_id),
+            DIRTY_KEY,
+        ],
+        args=[column, delta, fixture_id, "1" if floor else "0"],
+    )
+    return int(result[0]), int(result[1]) if len(result) > 1 else None
+
+
+async def apply(
+    db: AsyncSession, fixture_id: int, column: str, delta: int, floor: bool
+):
+    """Change a counter in Redis in the caller's transaction."""
+    # The change is reverted when this transaction ends without a commit
+    await db.connection()
+
+    status, value = await change(fixture_id, column, delta, floor)
+    if status == 0:
+        if fixture_id not in await load(db, [fixture_id]):
+            return 0, None
+        status, value = await change(fixture_id, column, delta, floor)
+
+    if status == 1:
+        db.info.setdefault("inventory", []).append((fixture_id, column, delta))
+    return status, value
+
+
+async def take(
+    db: AsyncSession, fixture_id: int, quantity: int, column: str = "remaining_bets"
+) -> Optional[int]:
+    """Take bets from a fixture if enough are left.
+
+    Returns the bets left, or None when the fixture does not exist or has
+    fewer than ``quantity`` left.
+    """
+    if not enabled():
+        return await fixtures.take_bets(db, fixture_id, quantity, column)
+
+    status, value = await apply(db, fixture_id, column, -quantity, floor=True)
+    return value if status == 1 else None
+
+
+async def give(
+    db: AsyncSession, fixture_id: int, quantity: int, column: str = "remaining_bets"
+):
+    """Add bets to a fixture, a negative ``quantity`` removes them unchecked."""
+    if not enabled():
+        await fixtures.return_bets(db, fixture_id, quantity, column)
+        return
+
+    await apply(db, fixture_id, column, quantity, floor=False)
+
+
+async def get(
+    db: AsyncSession, fixture: models.FixtureModel, column: str = "remaining_bets"
+) -> int:
+    """Current value of a counter, the row of ``fixture`` lags behind in Redis mode."""
+    if not enabled():
+        return getattr(fixture, column) or 0
+
+    key = COUNTERS_KEY.format(fixture.id)
+    value = await client.hget(key, column)
+    if value is None and fixture.id in await load(db, [fixture.id]):
+        value = await client.hget(key, column)
+    return int(value or 0)
+
+
+def reserved_column(fixture: models.FixtureModel, result: str) -> Optional[str]:
+    """Reserved counter of ``fixture`` for an auction or purchase ``result``."""
+    match result:
+        case fixture.home_team.team.name:
+            return "reserved_home"
+        case fixture.away_team.team.name:
+            return "reserved_away"
+        case "---":
+            return "reserved_draw"
+    return None
+
+
+async def restore(token: str):
+    """Put the deltas of a flush that was not written back, to retry them."""
+    await restore_script(
+        keys=[DIRTY_KEY, CLAIMS_KEY, CLAIM_KEY.format(token)],
+        args=[DELTAS_KEY.format(""), token],
+    )
+
+
+async def finish(token: str):
+    """Drop the claim of a written flush."""
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.delete(CLAIM_KEY.format(token))
+        pipe.zrem(CLAIMS_KEY, token)
+        await pipe.execute()
+
+
+def written(token: str):
+    """Insert of the token of a flush, it can only succeed once."""
+    return insert(models.InventoryFlushModel).values(
+        token=token, created_at=datetime.now()
+    )
+
+
+async def recover(timeout: float = INVENTORY_FLUSH_TIMEOUT) -> int:
+    """Settle the claims older than ``timeout``, returning how many."""
+    tokens = await client.zrangebyscore(CLAIMS_KEY, "-inf", time.time() - timeout)
+    for token in tokens:
+        try:
+            async with async_session_local() as db:
+                await db.execute(written(token))
+                await db.commit()
+        except IntegrityError:
+            # Written before its replica could drop the claim
+            await finish(token)
+        else:
+            await restore(token)
+    return len(tokens)
+
+
+async def flush() -> int:
+    """Write one batch of deltas to Postgres, returning how many fixtures."""
+    token = str(uuid.uuid4())
+    raw = await take_deltas_script(
+        keys=[DIRTY_KEY, CLAIMS_KEY, CLAIM_KEY.format(token)],
+        args=[INVENTORY_FLUSH_BATCH, DELTAS_KEY.format(""), token, time.time()],
+    )
+    batch = [
+        (int(fixture_id), dict(zip(fields[::2], map(int, fields[1::2]))))
+        for fixture_id, fields in zip(raw[::2], raw[1::2])
+    ]
+    if not batch:
+        return 0
+
+    table = models.FixtureModel.__table__
+    statement = (
+        table.update()
+        .where(table.c.id == bindparam("fixture_id"))
+        .values(
+            {
+                column: table.c[column] + bindparam(f"delta_{column}")
+                for column in COUNTERS
+            }
+        )
+    )
+    try:
+        async with async_session_local() as db:
+            # Fails when recover already took this batch back
+            await db.execute(written(token))
+            await db.execute(
+                statement,
+                [
+                    {
+                        "fixture_id": fixture_id,
+                        **{
+                            f"delta_{column}": deltas.get(column, 0)
+                            for column in COUNTERS
+                        },
+                    }
+                    for fixture_id, deltas in batch
+                ],
+            )
+            await db.execute(
+                delete(models.InventoryFlushModel).where(
+                    models.InventoryFlushModel.created_at
+                    < datetime.now() - timedelta(seconds=FLUSH_TOKENS_TTL)
+                )
+            )
+            await db.commit()
+    except SQLAlchemyError:
+        await restore(token)
+        raise
+
+    await finish(token)
+    return len(batch)
+
+
+async def run():
+    """Flush the deltas until cancelled."""
+    while True:
+        try:
+            await recover()
+            while await flush() == INVENTORY_FLUSH_BATCH:
+                pass
+        except (SQLAlchemyError, RedisError) as e:
+            print(f"Inventory flush failed, retrying: {e}")
+        await asyncio.sleep(INVENTORY_FLUSH_INTERVAL)
+
+
+async def start():
+    """Connect to Redis, load the open fixtures and start the flusher."""
+    global client, change_script, load_script  # pylint: disable=global-statement
+    global take_deltas_script, restore_script  # pylint: disable=global-statement
+    global loop, flusher  # pylint: disable=global-statement
+    if not INVENTORY_REDIS_URL:
+        return
+
+    client = aioredis.from_url(INVENTORY_REDIS_URL, decode_responses=True)
+    change_script = client.register_script(CHANGE_SCRIPT)
+    load_script = client.register_script(LOAD_SCRIPT)
+    take_deltas_script = client.register_script(TAKE_DELTAS_SCRIPT)
+    restore_script = client.register_script(RESTORE_SCRIPT)
+    loop = asyncio.get_running_loop()
+
+    # Postgres catches up with the deltas left by the previous run first
+    try:
+        await recover()
+        while await flush() == INVENTORY_FLUSH_BATCH:
+            pass
+    except (SQLAlchemyError, RedisError) as e:
+        print(f"Inventory flush failed, deltas stay in Redis: {e}")
+
+    async with async_session_local() as db:
+        fixture_ids = (
+            await db.scalars(
+                select(models.FixtureModel.id).where(
+                    models.FixtureModel.status_short == "NS"
+                )
+            )
+        ).all()
+        for i in range(0, len(fixture_ids), INVENTORY_FLUSH_BATCH):
+            await load(db, fixture_ids[i : i + INVENTORY_FLUSH_BATCH])
+    print(f"Inventory loaded {len(fixture_ids)} open fixtures into Redis")
+
+    flusher = asyncio.create_task(run())
+
+
+async def stop():
+    """Stop the flusher after a last flush, and disconnect from Redis."""
+    global client, loop, flusher  # pylint: disable=global-statement
+    if flusher is not None:
+        flusher.cancel()
+        try:
+            await flusher
+        except asyncio.CancelledError:
+            pass
+        try:
+            while await flush() == INVENTORY_FLUSH_BATCH:
+                pass
+        except (SQLAlchemyError, RedisError) as e:
+            print(f"Inventory flush failed, deltas stay in Redis: {e}")
+    if client is not None:
+        await client.aclose()
+    client = loop = flusher = None
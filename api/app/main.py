@@ -3,15 +3,16 @@
 # pylint: disable=W0613
 
 import os
+from contextlib import asynccontextmanager
 
+from app import http_client, inventory, outbox, settlement
 from app.routers import auctions, discounts, fixtures
 from app.routers import requests as requestRouter
 from app.routers import tests, users
 from fastapi import FastAPI
 from fastapi.responses import FileResponse, RedirectResponse
 
-from db import models
-from db.database import engine
+from db.async_database import async_engine
 
 if os.getenv("ENV") != "production":
     from dotenv import load_dotenv
@@ -22,7 +23,23 @@ if os.getenv("ENV") != "production":
 PATH_FIXTURES = os.getenv("PATH_FIXTURES")
 
 
-app = FastAPI(root_path="/v2")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop application scoped resources."""
+    http_client.start()
+    outbox.start()
+    await inventory.start()
+    settlement.start()
+    yield
+    await settlement.stop()
+    await inventory.stop()
+    await outbox.stop()
+    await http_client.close()
+    settlement.shutdown()
+    await async_engine.dispose()
+
+
+app = FastAPI(root_path="/v2", lifespan=lifespan)
 
 if os.getenv("ENV") != "production":
     from starlette.middleware.cors import CORSMiddleware
@@ -35,8 +52,6 @@ if os.getenv("ENV") != "production":
         allow_headers=["*"],
     )
 
-models.Base.metadata.create_all(bind=engine)
-
 app.include_router(users.router)
 app.include_router(requestRouter.router)
 app.include_router(fixtures.router)
@@ -0,0 +1,161 @@
+"""Relay of the transactional outbox to the publisher.
+
+Purchases write the messages they produce to the ``outbox`` table in the same
+transaction as the business change, through ``publish.add_to_outbox``. This
+relay sends them to the publisher's batch endpoint in the background and
+deletes them once the publisher accepted them, so the HTTP request never waits
+for the publisher and a rolled back purchase never publishes anything.
+
+Every API replica runs a relay. On Postgres each batch is locked with
+``FOR UPDATE SKIP LOCKED``, so replicas drain different rows instead of
+publishing the same message twice.
+
+Only the oldest pending message of an ``ordering_key`` can be claimed, so a
+validation is sent only after its request was accepted by the publisher,
+whichever replica holds the request.
+"""
+
+import asyncio
+import os
+
+import httpx
+from app import publish
+from sqlalchemy import event, exists
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, aliased
+
+from db import models
+from db.database import session_local
+
+# Messages sent to the publisher per call
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+
+# Seconds between polls when no commit wakes the relay up
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+
+# Maximum seconds to wait before retrying while the publisher is unreachable
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "30"))
+
+wakeup = asyncio.Event()
+loop: asyncio.AbstractEventLoop | None = None
+relay: asyncio.Task | None = None
+
+
+# Registered on the Session class so commits of the async sessions, which run
+# on a sync Session underneath, wake the relay up too
+@event.listens_for(Session, "after_commit")
+def notify_relay(session: Session):
+    """Wake the relay up when a transaction committed outbox messages."""
+    # Sync endpoints commit from the threadpool, not from the event loop
+    if session.info.pop("outbox", False) and loop is not None:
+        loop.call_soon_threadsafe(wakeup.set)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_outbox(session: Session):
+    """Messages of a rolled back transaction were never written."""
+    session.info.pop("outbox", None)
+
+
+def claim(db: Session) -> list:
+    """Lock the next batch of pending messages."""
+    earlier = aliased(models.OutboxModel)
+    query = (
+        db.query(models.OutboxModel)
+        .filter(models.OutboxModel.rejected.is_(False))
+        # Held back while an earlier message of its key is pending or locked
+        .filter(
+            ~exists().where(
+                earlier.ordering_key == models.OutboxModel.ordering_key,
+                earlier.id < models.OutboxModel.id,
+            )
+        )
+        .order_by(models.OutboxModel.id)
+        .limit(OUTBOX_BATCH_SIZE)
+    )
+    if db.get_bind().dialect.name == "postgresql":
+        query = query.with_for_update(skip_locked=True)
+    return query.all()
+
+
+def record(db: Session, messages: list, results: list) -> int:
+    """Delete the accepted messages and release the batch."""
+    published = 0
+    for message, result in zip(messages, results):
+        if result["status"] == "queued":
+            db.delete(message)
+            published += 1
+            continue
+
+        # A full publisher queue is retried on the next poll, an unknown
+        # topic will never be accepted and stays in the table for inspection
+        message.attempts += 1
+        message.error = str(result.get("detail"))[:255]
+        message.rejected = result["status"] == "rejected"
+        print(f"Outbox message {message.id} not published: {message.error}")
+
+    db.commit()
+    return published
+
+
+async def drain() -> int:
+    """Send one batch of pending messages, returning how many were published."""
+    db = session_local()
+    try:
+        # The session is used by one thread at a time, the batch stays locked
+        # while the publisher answers
+        messages = await asyncio.to_thread(claim, db)
+        if not messages:
+            return 0
+
+        results = await publish.post_batch(
+            [(message.topic, str(message.payload)) for message in messages]
+        )
+        return await asyncio.to_thread(record, db, messages, results)
+    finally:
+        await asyncio.to_thread(db.close)
+
+
+async def run():
+    """Drain the outbox until cancelled, backing off while the publisher is down."""
+    backoff = OUTBOX_POLL_INTERVAL
+    while True:
+        wakeup.clear()
+        try:
+            # A published message can let the next one of its key through
+            while await drain():
+                pass
+            backoff = OUTBOX_POLL_INTERVAL
+        except (httpx.HTTPError, SQLAlchemyError, KeyError, ValueError) as e:
+            print(f"Outbox relay failed, retrying in {backoff} s: {e}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, OUTBOX_MAX_BACKOFF)
+            continue
+
+        try:
+            await asyncio.wait_for(wakeup.wait(), OUTBOX_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start():
+    """Start the relay on the running event loop."""
+    global loop, relay  # pylint: disable=global-statement
+    loop = asyncio.get_running_loop()
+    relay = asyncio.create_task(run())
+
+
+async def stop():
+    """Stop the relay.
+
+    A batch interrupted before the publisher answered is rolled back and sent
+    again by the next relay that starts.
+    """
+    global loop, relay  # pylint: disable=global-statement
+    if relay is not None:
+        relay.cancel()
+        try:
+            await relay
+        except asyncio.CancelledError:
+            pass
+    loop = relay = None
@@ -3,37 +3,35 @@
 import os
 import uuid
 from datetime import datetime, timezone
-from typing import Optional
+from typing import List, Optional, Tuple
 
-import requests as http_requests
+import httpx
+from app import http_client, inventory
 from app.crud import fixtures, requests, users
 from app.schemas import request_schemas, response_schemas
 from fastapi import HTTPException
-from requests.exceptions import RequestException
-from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
 
-PUBLISHER_HOST = os.getenv("PUBLISHER_HOST")
-PUBLISHER_PORT = os.getenv("PUBLISHER_PORT")
+from db import models
 
 GROUP_ID = os.getenv("GROUP_ID")
 
-POST_TOKEN = os.getenv("POST_TOKEN")
 
-
-def create_request(
-    db: Session,
+async def create_request(
+    db: AsyncSession,
     req: request_schemas.RequestShort,
     deposit_token: str = "",
     request_id: Optional[str] = None,
 ):
     """Create a request."""
 
-    db_fixture = fixtures.get_fixture_by_id(db, req.fixture_id)
+    db_fixture = await fixtures.get_fixture(db, req.fixture_id)
 
     if db_fixture is None:
         raise HTTPException(status_code=404, detail="Fixture not found")
 
-    db_user = users.get_user(db, req.uid)
+    db_user = await users.get_user(db, req.uid)
 
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
@@ -53,32 +51,28 @@ def create_request(
         seller=0 if not bool(db_user.admin) else int(GROUP_ID) if GROUP_ID else 2,
     )
 
-    publish_request(published_request)
+    add_to_outbox(
+        db,
+        "fixtures/requests",
+        published_request,
+        key=str(published_request.request_id),
+    )
 
     return published_request
 
 
-def publish_request(request: response_schemas.Request):
-    """Publish a request."""
-    # Publish the request to the broker
-    url = f"http://{PUBLISHER_HOST}:{PUBLISHER_PORT}/"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {POST_TOKEN}",
-    }
-    response = http_requests.post(
-        url,
-        json={"payload": request.model_dump_json()},
-        headers=headers,
-        timeout=30,
+async def post_payload(path: str, message: BaseModel):
+    """Send one message to a topic endpoint of the publisher."""
+    response = await http_client.publisher().post(
+        path, json={"payload": message.model_dump_json()}
     )
     if response.status_code != 200:
-        raise RequestException(response.text)
+        raise httpx.HTTPError(response.text)
 
 
-def create_validation(db: Session, req: request_schemas.RequestValidation):
+async def create_validation(db: AsyncSession, req: request_schemas.RequestValidation):
     """Create a request validation."""
-    db_request = requests.get_request_by_id(db, req.request_id)  # type: ignore
+    db_request = await requests.get_request_by_id(db, req.request_id)  # type: ignore
 
     if db_request is None:
         return None
@@ -90,47 +84,23 @@ def create_validation(db: Session, req: request_schemas.RequestValidation):
         valid=req.valid,
     )
 
-    publish_validation(request)
+    add_to_outbox(db, "fixtures/validation", request, key=str(req.request_id))
 
     return request
 
 
-def publish_validation(request: response_schemas.RequestValidation):
-    """Publish a request validation."""
-    # Publish the request to the broker
-    url = f"http://{PUBLISHER_HOST}:{PUBLISHER_PORT}/validate"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {POST_TOKEN}",
-    }
-    response = http_requests.post(
-        url,
-        json={"payload": request.model_dump_json()},
-        headers=headers,
-        timeout=30,
-    )
-    if response.status_code != 200:
-        raise RequestException(response.text)
-
-
-def create_offer(db: Session, offer: request_schemas.OfferShort):
+async def create_offer(db: AsyncSession, offer: request_schemas.OfferShort):
     """Create and publish an offer."""
 
-    db_fixture = fixtures.get_fixture_by_id(db, offer.fixture_id)
+    db_fixture = await fixtures.get_fixture(db, offer.fixture_id)
 
     if db_fixture is None:
         return None
 
-    match offer.result:
-        case db_fixture.home_team.team.name:
-            if offer.quantity > db_fixture.reserved_home:  # type: ignore
-                return None
-        case db_fixture.away_team.team.name:
-            if offer.quantity > db_fixture.reserved_away:  # type: ignore
-                return None
-        case "---":
-            if offer.quantity > db_fixture.reserved_draw:  # type: ignore
-                return None
+    # The counters in Redis are ahead of the row until the next flush
+    column = inventory.reserved_column(db_fixture, offer.result)
+    if column and offer.quantity > await inventory.get(db, db_fixture, column):
+        return None
 
     publish_offer = response_schemas.Auction(
         auction_id=uuid.uuid4(),
@@ -144,29 +114,23 @@ def create_offer(db: Session, offer: request_schemas.OfferShort):
         type="offer",
     )
 
-    publish_auction(publish_offer)
+    await publish_auction(publish_offer)
 
     return publish_offer
 
 
-def create_proposal(db: Session, proposal: request_schemas.ProposalShort):
+async def create_proposal(db: AsyncSession, proposal: request_schemas.ProposalShort):
     """Create and publish a proposal."""
 
-    db_fixture = fixtures.get_fixture_by_id(db, proposal.fixture_id)
+    db_fixture = await fixtures.get_fixture(db, proposal.fixture_id)
 
     if db_fixture is None:
         return None
 
-    match proposal.result:
-        case db_fixture.home_team.team.name:
-            if proposal.quantity > db_fixture.reserved_home:  # type: ignore
-                return None
-        case db_fixture.away_team.team.name:
-            if proposal.quantity > db_fixture.reserved_away:  # type: ignore
-                return None
-        case "---":
-            if proposal.quantity > db_fixture.reserved_draw:  # type: ignore
-                return None
+    # The counters in Redis are ahead of the row until the next flush
+    column = inventory.reserved_column(db_fixture, proposal.result)
+    if column and proposal.quantity > await inventory.get(db, db_fixture, column):
+        return None
 
     published_proposal = response_schemas.Auction(
         auction_id=proposal.auction_id,
@@ -180,12 +144,12 @@ def create_proposal(db: Session, proposal: request_schemas.ProposalShort):
         type="proposal",
     )
 
-    publish_auction(published_proposal)
+    await publish_auction(published_proposal)
 
     return published_proposal
 
 
-def create_acceptance(proposal: request_schemas.Proposal):
+async def create_acceptance(proposal: request_schemas.Proposal):
     """Accept a proposal."""
 
     published_proposal = response_schemas.Auction(
@@ -200,12 +164,12 @@ def create_acceptance(proposal: request_schemas.Proposal):
         type="acceptance",
     )
 
-    publish_auction(published_proposal)
+    await publish_auction(published_proposal)
 
     return published_proposal
 
 
-def create_rejection(proposal: request_schemas.Proposal):
+async def create_rejection(proposal: request_schemas.Proposal):
     """Reject a proposal."""
 
     published_proposal = response_schemas.Auction(
@@ -220,24 +184,46 @@ def create_rejection(proposal: request_schemas.Proposal):
         type="rejection",
     )
 
-    publish_auction(published_proposal)
+    await publish_auction(published_proposal)
 
     return published_proposal
 
 
-def publish_auction(auction: response_schemas.Auction):
+async def publish_auction(auction: response_schemas.Auction):
     """Publish an auction."""
-    # Publish the auction to the broker
-    url = f"http://{PUBLISHER_HOST}:{PUBLISHER_PORT}/auction"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {POST_TOKEN}",
-    }
-    response = http_requests.post(
-        url,
-        json={"payload": auction.model_dump_json()},
-        headers=headers,
-        timeout=30,
+    await post_payload("/auction", auction)
+
+
+def add_to_outbox(
+    db: AsyncSession, topic: str, message: BaseModel, key: Optional[str] = None
+):
+    """Queue a message to be published once the caller's transaction commits.
+
+    The outbox relay sends it to the publisher, so the message is published
+    if and only if the business change that produced it is committed.
+    Messages with the same ``key`` are published in the order they were added.
+    """
+    db.add(
+        models.OutboxModel(
+            topic=topic,
+            payload=message.model_dump_json(),
+            ordering_key=key,
+            attempts=0,
+            rejected=False,
+        )
+    )
+    db.info["outbox"] = True
+
+
+async def post_batch(messages: List[Tuple[str, str]]) -> List[dict]:
+    """Send already serialized messages to the publisher's batch endpoint."""
+    if not messages:
+        return []
+
+    response = await http_client.publisher().post(
+        "/batch",
+        json=[{"topic": topic, "payload": payload} for topic, payload in messages],
     )
     if response.status_code != 200:
-        raise RequestException(response.text)
+        raise httpx.HTTPError(response.text)
+    return response.json()["results"]
@@ -0,0 +1,165 @@
+"""Changes of the requests, pushed to the WebSockets of their users.
+
+A client of ``/requests/{user_id}`` gets a first page of its requests and then
+one event per changed request, instead of its whole history after every
+change. Events carry a sequence number that grows with every change in this
+replica, and the first page the sequence it is current to. ``STREAM`` names
+this run of the replica, so sequences from before a restart are not taken for
+current ones.
+
+The last ``REQUESTS_EVENTS_BUFFER`` events of the last ``REQUESTS_EVENTS_USERS``
+users with changes are kept: a client that reconnects with the ``stream`` and
+the last sequence it saw gets only the events it missed, or a first page again
+when they are no longer kept. Each event is encoded once, however many
+sockets the user has open. A socket that falls ``REQUESTS_EVENTS_BUFFER``
+events behind is closed, to resume.
+"""
+
+import asyncio
+import json
+import os
+import uuid
+from collections import OrderedDict, deque
+from typing import Optional
+
+from app.schemas.response_schemas import RequestShort
+from fastapi import WebSocket
+
+# Events kept per user to resume from
+REQUESTS_EVENTS_BUFFER = int(os.getenv("REQUESTS_EVENTS_BUFFER", "100"))
+
+# Users whose events are kept
+REQUESTS_EVENTS_USERS = int(os.getenv("REQUESTS_EVENTS_USERS", "10000"))
+
+# WebSocket close code of a socket too far behind, "try again later"
+OVERFLOW_CLOSE_CODE = 1013
+
+STREAM = uuid.uuid4().hex
+
+
+class History:
+    """Recent events of a user."""
+
+    def __init__(self, dropped: int):
+        self.events: deque = deque(maxlen=REQUESTS_EVENTS_BUFFER)
+        # Events up to this sequence may be missing
+        self.dropped = dropped
+
+
+class Subscriber:
+    """An open socket of a user and the events waiting to be sent to it."""
+
+    def __init__(self, user_id: str, websocket: WebSocket):
+        self.user_id = user_id
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=REQUESTS_EVENTS_BUFFER)
+        self.lock = asyncio.Lock()
+        self.sender: asyncio.Task | None = None
+        self.closed = False
+
+    async def send(self, text: str):
+        """Send a message, one at a time."""
+        async with self.lock:
+            await self.websocket.send_text(text)
+
+    async def run(self):
+        """Send the queued events until cancelled."""
+        while True:
+            await self.send(await self.queue.get())
+
+    def start(self):
+        """Start sending the queued events, after the first page."""
+        self.sender = asyncio.create_task(self.run())
+
+    def push(self, text: str):
+        """Queue an event, closing the socket when it is too far behind."""
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            self.closed = True
+            asyncio.create_task(self.websocket.close(code=OVERFLOW_CLOSE_CODE))
+
+
+sequence = 0
+# Events up to this sequence of the users no longer kept may be missing
+forgotten = 0
+histories: OrderedDict = OrderedDict()
+subscribers: dict = {}
+
+
+def subscribe(user_id: str, websocket: WebSocket) -> Subscriber:
+    """Queue the events of a user for a socket."""
+    subscriber = Subscriber(user_id.strip(), websocket)
+    subscribers.setdefault(subscriber.user_id, set()).add(subscriber)
+    return subscriber
+
+
+def unsubscribe(subscriber: Subscriber):
+    """Stop sending events to a socket."""
+    if subscriber.sender is not None:
+        subscriber.sender.cancel()
+    user_subscribers = subscribers.get(subscriber.user_id, set())
+    user_subscribers.discard(subscriber)
+    if not user_subscribers:
+        subscribers.pop(subscriber.user_id, None)
+
+
+def publish(db_request):
+    """Push a changed request to the sockets of its user."""
+    global sequence, forgotten  # pylint: disable=global-statement
+    if db_request.user_id is None:
+        return
+    user_id = str(db_request.user_id).strip()
+
+    sequence += 1
+    text = json.dumps(
+        {
+            "type": "request",
+            "seq": sequence,
+            "request": RequestShort.model_validate(db_request).model_dump(mode="json"),
+        }
+    )
+
+    history = histories.get(user_id)
+    if history is None:
+        history = histories[user_id] = History(forgotten)
+        while len(histories) > REQUESTS_EVENTS_USERS:
+            _, oldest = histories.popitem(last=False)
+            forgotten = max(forgotten, oldest.events[-1][0])
+    else:
+        histories.move_to_end(user_id)
+    if len(history.events) == history.events.maxlen:
+        history.dropped = history.events[0][0]
+    history.events.append((sequence, text))
+
+    for subscriber in subscribers.get(user_id, ()):
+        subscriber.push(text)
+
+
+def missed(user_id: str, stream: Optional[str], since: int) -> Optional[list]:
+    """Events of a user after ``since``, or None when they are not all kept."""
+    if stream != STREAM or since > sequence:
+        return None
+    history = histories.get(user_id.strip())
+    dropped = forgotten if history is None else history.dropped
+    if since < dropped:
+        return None
+    if history is None:
+        return []
+    return [text for seq, text in history.events if seq > since]
+
+
+def page(requests: list, count: int, seq: Optional[int] = None) -> str:
+    """Encode a page of requests, the first one with the sequence it is current to."""
+    message = {
+        "type": "page",
+        "requests": [request.model_dump(mode="json") for request in requests],
+        "next": (
+            requests[-1].request_id if requests and len(requests) == count else None
+        ),
+    }
+    if seq is not None:
+        message.update(stream=STREAM, seq=seq)
+    return json.dumps(message)
@@ -8,9 +8,9 @@ from app.crud import auctions
 from app.dependencies import verify_admin, verify_post_token
 from app.schemas import request_schemas, response_schemas
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.database import get_db
+from db.async_database import get_async_db
 
 PATH_AUCTIONS = os.getenv("PATH_AUCTIONS")
 
@@ -38,13 +38,13 @@ if not PATH_AUCTIONS:
 )
 async def publish_offer(
     offer: request_schemas.OfferShort,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Publish an offer."""
 
-    verify_admin(user_id=offer.uid, db=db)
+    await verify_admin(user_id=offer.uid, db=db)
 
-    return publish.create_offer(db, offer)
+    return await publish.create_offer(db, offer)
 
 
 # GET /offers
@@ -55,13 +55,13 @@ async def publish_offer(
 )
 async def get_offers(
     user_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Get all offers."""
 
-    verify_admin(user_id=user_id, db=db)
+    await verify_admin(user_id=user_id, db=db)
 
-    return auctions.get_offers(db)
+    return await auctions.get_offers(db)
 
 
 # POST /proposals
@@ -72,13 +72,13 @@ async def get_offers(
 )
 async def publish_proposal(
     proposal: request_schemas.ProposalShort,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Publish a proposal."""
 
-    verify_admin(user_id=proposal.uid, db=db)
+    await verify_admin(user_id=proposal.uid, db=db)
 
-    return publish.create_proposal(db, proposal)
+    return await publish.create_proposal(db, proposal)
 
 
 # GET /proposals
@@ -89,13 +89,13 @@ async def publish_proposal(
 )
 async def get_proposals(
     user_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Get all proposals."""
 
-    verify_admin(user_id=user_id, db=db)
+    await verify_admin(user_id=user_id, db=db)
 
-    return auctions.get_proposals(db)
+    return await auctions.get_proposals(db)
 
 
 # POST /accept
@@ -106,20 +106,20 @@ async def get_proposals(
 )
 async def accept_proposal(
     request: request_schemas.ProposalRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Accept a proposal."""
 
-    verify_admin(user_id=request.user_id, db=db)
+    await verify_admin(user_id=request.user_id, db=db)
 
     print(request.proposal_id)
 
-    proposal = auctions.get_proposal(db, request.proposal_id)
+    proposal = await auctions.get_proposal(db, request.proposal_id)
 
     if not proposal:
         raise HTTPException(status_code=404, detail="Proposal not found")
 
-    return publish.create_acceptance(proposal)
+    return await publish.create_acceptance(proposal)
 
 
 # POST /reject
@@ -130,18 +130,18 @@ async def accept_proposal(
 )
 async def reject_proposal(
     request: request_schemas.ProposalRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Reject a proposal."""
 
-    verify_admin(user_id=request.user_id, db=db)
+    await verify_admin(user_id=request.user_id, db=db)
 
-    proposal = auctions.get_proposal(db, request.proposal_id)
+    proposal = await auctions.get_proposal(db, request.proposal_id)
 
     if not proposal:
         raise HTTPException(status_code=404, detail="Proposal not found")
 
-    return publish.create_rejection(proposal)
+    return await publish.create_rejection(proposal)
 
 
 #########################################################
@@ -157,14 +157,14 @@ async def reject_proposal(
 )
 async def upsert_auction(
     auction: request_schemas.Auction,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: None = Depends(verify_post_token),
 ):
     """Upsert an auction."""
     if auction.type == "offer":
-        return auctions.upsert_offer(db, auction)
+        return await auctions.upsert_offer(db, auction)
     elif auction.type == "proposal":
-        return auctions.upsert_proposal(db, auction)
+        return await auctions.upsert_proposal(db, auction)
     else:
         raise HTTPException(status_code=400, detail="Invalid type")
 
@@ -177,14 +177,14 @@ async def upsert_auction(
 )
 async def update_auction(
     auction: request_schemas.Auction,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: None = Depends(verify_post_token),
 ):
     """Update an auction."""
 
     if auction.type == "acceptance":
-        auctions.handle_acceptance(db, auction)
+        await auctions.handle_acceptance(db, auction)
     elif auction.type == "rejection":
-        auctions.handle_rejection(db, auction)
+        await auctions.handle_rejection(db, auction)
     else:
         raise HTTPException(status_code=400, detail="Invalid type")
@@ -4,9 +4,9 @@ import sys
 from app.crud import discounts
 from app.dependencies import verify_admin
 from fastapi import APIRouter, Depends, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.database import get_db
+from db.async_database import get_async_db
 
 PATH_DISCOUNTS = os.getenv("PATH_DISCOUNTS")
 
@@ -27,9 +27,9 @@ if not PATH_DISCOUNTS:
     status_code=status.HTTP_200_OK,
 )
 async def get_discount(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    discount = discounts.get_discount(db)
+    discount = await discounts.get_discount(db)
 
     return {"discount": discount}
 
@@ -41,12 +41,12 @@ async def get_discount(
 )
 async def set_discount(
     user_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    verify_admin(user_id=user_id, db=db)
+    await verify_admin(user_id=user_id, db=db)
 
-    discount = discounts.get_discount(db)
+    discount = await discounts.get_discount(db)
 
-    discounts.set_discount(db, not discount)
+    await discounts.set_discount(db, not discount)
 
     return {"discount": not discount}
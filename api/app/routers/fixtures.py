@@ -3,13 +3,15 @@ import os
 import sys
 from typing import List, Optional
 
-import requests
+from app import http_client, settlement
 from app.crud import fixtures, users
 from app.dependencies import verify_post_token
 from app.schemas import request_schemas, response_schemas
 from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from db.async_database import get_async_db
 from db.database import get_db
 
 PATH_FIXTURES = os.getenv("PATH_FIXTURES")
@@ -86,9 +88,9 @@ def get_tradeable_fixtures(
     response_model=response_schemas.Fixture,
     status_code=status.HTTP_200_OK,
 )
-def get_fixture(fixture_id: int, db: Session = Depends(get_db)):
+async def get_fixture(fixture_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a fixture."""
-    db_fixture = fixtures.get_fixture_by_id(db, fixture_id)
+    db_fixture = await fixtures.get_fixture(db, fixture_id, details=True)
     if db_fixture is None:
         raise HTTPException(status_code=404, detail="Fixture not found")
     return db_fixture
@@ -99,19 +101,18 @@ def get_fixture(fixture_id: int, db: Session = Depends(get_db)):
     "/recommended",
     status_code=status.HTTP_201_CREATED,
 )
-def post_recommended_fixtures(
-    user_info: request_schemas.UserInfo, db: Session = Depends(get_db)
+async def post_recommended_fixtures(
+    user_info: request_schemas.UserInfo, db: AsyncSession = Depends(get_async_db)
 ):
     """Post recommended fixtures."""
     user_id = user_info.user_id
-    url = "http://arquisis-jobs-master:7998/job"
-    headers = {"Content-Type": "application/json"}
     user = {"user_id": user_id}
-    job_id = requests.post(url, headers=headers, json=user).json()
+    response = await http_client.jobs_master().post("/job", json=user)
+    job_id = response.json()
 
-    db_user = users.get_user(db, user_id)
+    db_user = await users.get_user(db, user_id)
     db_user.job_id = job_id["job_id"]  # type: ignore
-    db.commit()
+    await db.commit()
 
     return job_id
 
@@ -122,10 +123,12 @@ def post_recommended_fixtures(
     response_model=response_schemas.RecommendedFixture,
     status_code=status.HTTP_200_OK,
 )
-def get_recommended_fixtures(user_id: str, db: Session = Depends(get_db)):
+async def get_recommended_fixtures(
+    user_id: str, db: AsyncSession = Depends(get_async_db)
+):
     """Get recommended fixtures."""
 
-    db_user = users.get_user(db, user_id)
+    db_user = await users.get_user(db, user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -134,14 +137,13 @@ def get_recommended_fixtures(user_id: str, db: Session = Depends(get_db)):
     if job_id is None:
         return {"fixtures": [], "last_updated": datetime.datetime.now()}
 
-    url = f"http://arquisis-jobs-master:7998/job/{job_id}"
-    headers = {"Content-Type": "application/json"}
-    user_recommendations = requests.get(url, headers=headers).json()
+    response = await http_client.jobs_master().get(f"/job/{job_id}")
+    user_recommendations = response.json()
 
     if user_recommendations["status"] != "Completed":
         return {"fixtures": [], "last_updated": datetime.datetime.now()}
 
-    recommended_fixtures = fixtures.get_recommendations(
+    recommended_fixtures = await fixtures.get_recommendations(
         db, user_recommendations["result"]
     )
 
@@ -162,7 +164,7 @@ def get_recommended_fixtures(user_id: str, db: Session = Depends(get_db)):
     response_model=response_schemas.Fixture,
     status_code=status.HTTP_201_CREATED,
 )
-async def upsert_fixture(
+def upsert_fixture(
     fixture: request_schemas.WholeFixture,
     db: Session = Depends(get_db),
     token: None = Depends(verify_post_token),
@@ -171,6 +173,48 @@ async def upsert_fixture(
     return fixtures.upsert_fixture(db, fixture)
 
 
+# POST /fixtures/bulk
+@router.post(
+    "/bulk",
+    response_model=response_schemas.FixtureBatch,
+    status_code=status.HTTP_201_CREATED,
+)
+def upsert_fixtures(
+    batch: List[request_schemas.WholeFixture],
+    db: Session = Depends(get_db),
+    token: None = Depends(verify_post_token),
+):
+    """Upsert a whole fixtures broadcast in one transaction."""
+    return fixtures.bulk_upsert_fixtures(db, batch)
+
+
+# PATCH /fixtures/history/bulk
+@router.patch(
+    "/history/bulk",
+    response_model=response_schemas.FixtureHistoryBatch,
+    status_code=status.HTTP_201_CREATED,
+)
+def update_fixtures_history(
+    batch: List[request_schemas.FixtureUpdate],
+    db: Session = Depends(get_db),
+    token: None = Depends(verify_post_token),
+):
+    """Apply a fixtures/history broadcast in one transaction."""
+    db_fixtures = fixtures.bulk_update_fixtures(db, batch)
+
+    updated = {db_fixture.id for db_fixture in db_fixtures}
+    finished = fixtures.get_unsettled_fixture_ids(
+        db,
+        [db_fixture.id for db_fixture in db_fixtures if db_fixture.status_short == "FT"],
+    )
+
+    return {
+        "updated": len(updated),
+        "missing": sorted({update.fixture.id for update in batch} - updated),
+        "settling": settlement.submit(finished),
+    }
+
+
 # PATCH /fixtures/{fixture_id}
 @router.patch(
     "/{fixture_id}",
@@ -189,6 +233,7 @@ def update_fixture(
     if db_fixture is None:
         raise HTTPException(status_code=404, detail="Fixture not found")
 
-    fixtures.pay_bets(db, fixture_id)
+    if db_fixture.status_short == "FT":
+        settlement.submit(fixtures.get_unsettled_fixture_ids(db, [fixture_id]))
 
     return db_fixture
@@ -3,13 +3,15 @@
 # pylint: disable=E0402, W0613
 
 import asyncio
+import json
 import os
 import smtplib
 import sys
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from typing import Optional
 
-from app import publish
+from app import inventory, publish, request_events
 from app.crud import requests, users
 from app.dependencies import check_backend_bets  # ? But why tho?
 from app.dependencies import (
@@ -26,14 +28,15 @@ from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
+    Query,
     WebSocket,
     WebSocketDisconnect,
     status,
 )
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from transbank.error import transbank_error
 
-from db.database import get_db
+from db.async_database import async_session_local, get_async_db
 
 PATH_REQUESTS = os.getenv("PATH_REQUESTS")
 if not PATH_REQUESTS:
@@ -80,41 +83,55 @@ router = APIRouter(
 #                   REQUESTS - FRONTEND                        #
 ################################################################
 
-connected_clients = []
-
-
 # GET /requests/{user_id}
 @router.websocket("/{user_id}")
 async def get_requests(
     websocket: WebSocket,
     user_id: str,
-    db: Session = Depends(get_db),
+    since: Optional[int] = None,
+    stream: Optional[str] = None,
+    count: int = Query(25, ge=1, le=100),
 ):
-    """Get requests."""
+    """Push the requests of a user.
+
+    Sends a page of the newest requests, then an event per changed request.
+    Reconnecting with the ``stream`` and the last ``seq`` seen as ``since``
+    sends only the events missed while they are kept. ``{"before": next}``
+    asks for the next page.
+    """
     await websocket.accept()
-    connected_clients.append((websocket, user_id))
+    subscriber = request_events.subscribe(user_id, websocket)
 
-    db_requests = requests.get_requests(db, user_id)
-    await websocket.send_json([request.dict() for request in db_requests])
+    async def send_page(before: Optional[str] = None):
+        # Events after this sequence are queued, and sent after the page
+        seq = request_events.sequence if before is None else None
+        # A short session per page, the socket stays open for long
+        async with async_session_local() as db:
+            db_requests = await requests.get_requests(db, user_id, before, count)
+        await subscriber.send(request_events.page(db_requests, count, seq))
 
     try:
+        events = None
+        if since is not None:
+            events = request_events.missed(user_id, stream, since)
+        if events is None:
+            await send_page()
+        else:
+            for text in events:
+                await subscriber.send(text)
+        subscriber.start()
+
         while True:
-            await websocket.receive_text()  # Keep the connection open
+            message = await websocket.receive_text()
+            try:
+                before = json.loads(message)["before"]
+            except (ValueError, TypeError, KeyError):
+                continue  # Keep the connection open
+            await send_page(str(before))
     except WebSocketDisconnect:
-        connected_clients.remove((websocket, user_id))
-        print("Disconnected clients: ", len(connected_clients))
-
-
-def notify_clients(user_id: str, requests):
-    if user_id is None:
-        return
-    print(f"Notifying {len(connected_clients)} clients")
-    for websocket, uid in connected_clients:
-        if uid.strip() == user_id.strip():
-            print("Sending message", requests)
-            asyncio.create_task(
-                websocket.send_json([request.dict() for request in requests])
-            )
+        pass
+    finally:
+        request_events.unsubscribe(subscriber)
 
 
 # POST /requests/webpay
@@ -125,37 +142,43 @@ def notify_clients(user_id: str, requests):
 )
 async def start_webpay_flow(
     request: request_schemas.RequestShort,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     location: str = Depends(get_location),
     bets: None = Depends(check_bets),
 ):
     """Start the Webpay flow."""
 
     amount: int = request.quantity * BET_PRICE  # type: ignore
-    transaction = requests.create_transaction(db, request)
+    transaction = await requests.create_transaction(db, request)
 
     try:
-        transaction_response = webpay_plus_transaction.create(
-            str(transaction.id), SESSION_ID, amount, TRANSBANK_REDIRECT_URL  # type: ignore
+        # The Transbank SDK is blocking, keep it off the event loop
+        transaction_response = await asyncio.to_thread(
+            webpay_plus_transaction.create,
+            str(transaction.id),
+            SESSION_ID,
+            amount,
+            TRANSBANK_REDIRECT_URL,
         )
         transaction.token = transaction_response["token"]
-        db.commit()
 
     except transbank_error.TransbankError as e:
         transaction.status = "aborted"  # type: ignore
-        db.commit()
+        await inventory.give(db, request.fixture_id, request.quantity)
+        await db.commit()
         raise HTTPException(status_code=500, detail=str(e)) from e
 
-    publish.create_request(
+    # Committed together with the token, the outbox relay publishes it
+    await publish.create_request(
         db=db,
         req=request,
         deposit_token=transaction.token,
         request_id=transaction.request_id,  # type: ignore
     )
+    await db.commit()
 
     asyncio.create_task(
         requests.link_request(
-            db,
             request_schemas.Link(
                 uid=transaction.user_id,  # type: ignore
                 request_id=transaction.request_id,  # type: ignore
@@ -180,21 +203,23 @@ async def start_webpay_flow(
 )
 async def commit_transaction(
     request: request_schemas.CommitTransaction,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Commit a transaction."""
 
-    transaction = requests.get_transaction(db, request.token)
+    transaction = await requests.get_transaction(db, request.token)
 
     if transaction is None:
         raise HTTPException(status_code=404, detail="Transaction not found")
 
     try:
-        confirmed_transaction = webpay_plus_transaction.commit(request.token)
+        confirmed_transaction = await asyncio.to_thread(
+            webpay_plus_transaction.commit, request.token
+        )
         aborted = False
     except transbank_error.TransbankError:
         transaction.status = "aborted"  # type: ignore
-        db.commit()
+        await db.commit()
         valid = False
         aborted = True
 
@@ -208,7 +233,7 @@ async def commit_transaction(
         transaction.status = "approved"  # type: ignore
         valid = True
 
-    publish.create_validation(
+    await publish.create_validation(
         db,
         request_schemas.RequestValidation(
             request_id=transaction.request_id,  # type: ignore
@@ -217,8 +242,9 @@ async def commit_transaction(
             valid=valid,
         ),
     )
+    await db.commit()
 
-    user = users.get_user(db, transaction.user_id)  # type: ignore
+    user = await users.get_user(db, transaction.user_id)  # type: ignore
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -236,18 +262,22 @@ async def commit_transaction(
     message.attach(MIMEText(body, "plain"))
 
     try:
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(EMAIL, EMAIL_PASSWORD)  # type: ignore
-            server.send_message(message)
+        await asyncio.to_thread(send_email, message)
         print("Email sent successfully!")
     except Exception as e:
         print(f"Error sending email: {e}")
 
-    db.commit()
     return {"status": "ABORTED"} if aborted else confirmed_transaction
 
 
+def send_email(message: MIMEMultipart):
+    """Send an email through Gmail's SMTP server."""
+    with smtplib.SMTP("smtp.gmail.com", 587) as server:
+        server.starttls()
+        server.login(EMAIL, EMAIL_PASSWORD)  # type: ignore
+        server.send_message(message)
+
+
 # POST /requests/wallet
 @router.post(
     "/wallet",
@@ -255,17 +285,17 @@ async def commit_transaction(
 )
 async def start_wallet_flow(
     request: request_schemas.RequestShort,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     bets: None = Depends(check_bets),
     balance: None = Depends(check_balance),
     location: str = Depends(get_location),
 ):
     """Start the wallet payment method flow."""
-    published_request = publish.create_request(db, request)
+    published_request = await publish.create_request(db, request)
+    await db.commit()
 
     asyncio.create_task(
         requests.link_request(
-            db,
             request_schemas.Link(
                 uid=request.uid,
                 request_id=str(published_request.request_id),  # type: ignore
@@ -284,12 +314,12 @@ async def start_wallet_flow(
 )
 async def reserve_request(
     request: request_schemas.RequestShort,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     bets: str = Depends(check_reserved_bets),
     balance: None = Depends(check_discounted_balance),
 ):
     """Buy a reserve a request."""
-    db_request = requests.reserve_request(db, request, bets)
+    db_request = await requests.reserve_request(db, request, bets)
 
     if db_request is None:
         raise HTTPException(status_code=404, detail="Fixture not found")
@@ -308,15 +338,15 @@ async def reserve_request(
     response_model=response_schemas.Request,
     status_code=status.HTTP_201_CREATED,
 )
-def upsert_request(
+async def upsert_request(
     request: request_schemas.Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: None = Depends(verify_post_token),
     bets: None = Depends(check_backend_bets),
 ):
     """Upsert a new request."""
 
-    db_request = requests.upsert_request(db, request, wallet=False)
+    db_request = await requests.upsert_request(db, request, wallet=False)
 
     if db_request is None:
         raise HTTPException(status_code=404, detail="Fixture not found")
@@ -333,7 +363,7 @@ def upsert_request(
 async def update_request(
     request_id: str,
     request: request_schemas.RequestValidation,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: None = Depends(verify_post_token),
 ):
     """Update a request."""
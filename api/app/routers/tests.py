@@ -1,13 +1,7 @@
 from fastapi import APIRouter, HTTPException
-import requests
+import httpx
 from fastapi.responses import JSONResponse
-import os
-
-PUBLISHER_HOST = os.getenv("PUBLISHER_HOST")
-PUBLISHER_PORT = os.getenv("PUBLISHER_PORT")
-
-JOBS_MASTER_HOST = os.getenv("JOBS_MASTER_HOST")
-JOBS_MASTER_PORT = os.getenv("JOBS_MASTER_PORT")
+from app import http_client
 
 router = APIRouter(
     tags=["requests"],
@@ -21,37 +15,37 @@ router = APIRouter(
 
 # GET /publisher
 @router.get("/publisher/heartbeat")
-def get_publisher_status():
+async def get_publisher_status():
     """Get the status of the publisher. To test API-PUBLISHER connection."""
     try:
-        response = requests.get(f"http://{PUBLISHER_HOST}:{PUBLISHER_PORT}", timeout=30)
+        response = await http_client.publisher().get("/")
         response.raise_for_status()
         return JSONResponse(status_code=response.status_code, content=response.json())
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 # GET /jobs_master
 @router.get("/jobs_master/heartbeat")
-def get_jobs_master_status():
+async def get_jobs_master_status():
     """Get the status of the jobs_master."""
     try:
-        response = requests.get(f"http://{JOBS_MASTER_HOST}:{JOBS_MASTER_PORT}/heartbeat", timeout=30)
+        response = await http_client.jobs_master().get("/heartbeat")
         response.raise_for_status()
         return JSONResponse(status_code=response.status_code, content=response.json())
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 # GET /jobs_master/create_job - TODO delete this endpoint
 @router.get("/jobs_master/create_job/{user_id}")
-def create_sample_job(user_id: str):
+async def create_sample_job(user_id: str):
     try:
         payload = {
             "user_id": user_id
         }
-        response = requests.post(f"http://{JOBS_MASTER_HOST}:{JOBS_MASTER_PORT}/job", json=payload, timeout=30)
+        response = await http_client.jobs_master().post("/job", json=payload)
         response.raise_for_status()
         return JSONResponse(status_code=response.status_code, content=response.json())
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
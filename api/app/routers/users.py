@@ -1,12 +1,13 @@
 import os
 import sys
+from typing import Optional
 
 from app.crud import users
-from app.schemas import request_schemas
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from app.schemas import request_schemas, response_schemas
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.database import get_db
+from db.async_database import get_async_db
 
 PATH_USERS = os.getenv("PATH_USERS")
 if not PATH_USERS:
@@ -29,9 +30,11 @@ router = APIRouter(
     "/signup",
     status_code=status.HTTP_201_CREATED,
 )
-def create_user(user: request_schemas.User, db: Session = Depends(get_db)):
+async def create_user(
+    user: request_schemas.User, db: AsyncSession = Depends(get_async_db)
+):
     """Create a new user."""
-    return users.create_user(db, user)
+    return await users.create_user(db, user)
 
 
 # GET /wallet/{uid}
@@ -39,32 +42,68 @@ def create_user(user: request_schemas.User, db: Session = Depends(get_db)):
     "/wallet/{uid}",
     status_code=status.HTTP_200_OK,
 )
-def get_wallet(uid: str, db: Session = Depends(get_db)):
+async def get_wallet(uid: str, db: AsyncSession = Depends(get_async_db)):
     """Get the wallet of the user."""
     print("Uid is ", uid)
-    user = users.get_user(db, uid)
+    user = await users.get_user(db, uid)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return {"balance": user.wallet}
 
 
+# GET /wallet/{uid}/history
+@router.get(
+    "/wallet/{uid}/history",
+    response_model=response_schemas.WalletHistory,
+    status_code=status.HTTP_200_OK,
+)
+async def get_wallet_history(
+    uid: str,
+    before: Optional[int] = None,
+    count: int = Query(25, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get the wallet changes of the user, newest first.
+
+    Pass ``next`` of a page as ``before`` to get the following one.
+    """
+    history = await users.get_wallet_history(db, uid, before=before, count=count)
+    if history is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {
+        "entries": [
+            {
+                "id": entry.id,
+                "delta": entry.delta,
+                "reason": entry.reason,
+                "fixture_id": entry.fixture_id,
+                "request_id": entry.request_id,
+                "created_at": entry.created_at,
+                "balance": balance,
+            }
+            for entry, balance in history
+        ],
+        "next": history[-1][0].id if history and len(history) == count else None,
+    }
+
+
 # PATCH /wallet
 @router.patch(
     "/wallet",
     status_code=status.HTTP_200_OK,
 )
-def update_balance(
+async def update_balance(
     wallet: request_schemas.Wallet,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Update the balance of the user."""
-    return users.update_balance(db, wallet.uid, wallet.amount)
+    return await users.update_balance(db, wallet.uid, wallet.amount)
 
 
 @router.delete(
     "/{uid}",
     status_code=status.HTTP_200_OK,
 )
-def delete_user(uid: str, db: Session = Depends(get_db)):
+async def delete_user(uid: str, db: AsyncSession = Depends(get_async_db)):
     """Delete a user."""
-    return users.delete_user(db, uid)
+    return await users.delete_user(db, uid)
@@ -66,6 +66,18 @@ class Fixture(BaseModel):
         from_attributes = True
 
 
+class FixtureBatch(BaseModel):
+    inserted: int
+    updated: int
+    skipped: int
+
+
+class FixtureHistoryBatch(BaseModel):
+    updated: int
+    missing: List[int] = []
+    settling: List[int] = []
+
+
 class AvailableFixture(BaseModel):
 
     id: int
@@ -162,3 +174,18 @@ class Proposal(BaseModel):
     quantity: int
     group_id: Union[int, str]
     status: str
+
+
+class WalletEntry(BaseModel):
+    id: int
+    delta: float
+    reason: str
+    fixture_id: Optional[int] = None
+    request_id: Optional[str] = None
+    created_at: Optional[dt] = None
+    balance: float
+
+
+class WalletHistory(BaseModel):
+    entries: List[WalletEntry]
+    next: Optional[int] = None
@@ -0,0 +1,142 @@
+"""Background settlement of finished fixtures.
+
+Paying bets can touch thousands of requests, so it runs on a bounded worker
+pool instead of inside the HTTP request that reported the final score.
+
+Every API replica may receive the same history update, so each settlement
+takes a Postgres advisory lock on the fixture and checks the ``settlements``
+table before paying. Only one replica pays a fixture, and only once.
+
+A fixture skipped because another replica held its lock, or whose settlement
+failed, is not dropped: every ``SETTLEMENT_SWEEP_INTERVAL`` seconds each
+replica queues the finished fixtures that still have unpaid bets and no
+settlement record.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Iterable, List
+
+from app.crud import fixtures
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from db import models
+from db.database import session_local
+
+SETTLEMENT_WORKERS = int(os.getenv("SETTLEMENT_WORKERS", "4"))
+
+# Seconds between sweeps for finished fixtures left unsettled
+SETTLEMENT_SWEEP_INTERVAL = float(os.getenv("SETTLEMENT_SWEEP_INTERVAL", "60"))
+
+# First key of the two-key advisory locks, the second one is the fixture id
+SETTLEMENT_LOCK_NAMESPACE = 1
+
+executor = ThreadPoolExecutor(
+    max_workers=SETTLEMENT_WORKERS, thread_name_prefix="settlement"
+)
+
+# Fixtures queued or being settled in this process
+pending: set = set()
+pending_lock = Lock()
+
+sweeper: asyncio.Task | None = None
+
+
+def lock_fixture(db: Session, fixture_id: int) -> bool:
+    """Try to take the settlement lock of a fixture until the transaction ends."""
+    if db.get_bind().dialect.name != "postgresql":
+        return True
+
+    return bool(
+        db.execute(
+            text("SELECT pg_try_advisory_xact_lock(:namespace, :fixture_id)"),
+            {"namespace": SETTLEMENT_LOCK_NAMESPACE, "fixture_id": fixture_id},
+        ).scalar()
+    )
+
+
+def settle(fixture_id: int):
+    """Pay the bets of a fixture using a dedicated session."""
+    db = session_local()
+    try:
+        # Another replica holds the lock and will record the settlement, if
+        # it fails the sweep queues the fixture again
+        if not lock_fixture(db, fixture_id):
+            print(f"Fixture {fixture_id} is being settled elsewhere")
+            return
+
+        if db.get(models.SettlementModel, fixture_id) is not None:
+            return
+
+        # Commits the payouts and the settlement record, releasing the lock
+        fixtures.pay_bets(db, fixture_id)
+    except Exception as e:  # pylint: disable=broad-except
+        db.rollback()
+        print(f"Error settling fixture {fixture_id}: {e}")
+    finally:
+        db.close()
+        with pending_lock:
+            pending.discard(fixture_id)
+
+
+def submit(fixture_ids: Iterable[int]) -> List[int]:
+    """Queue fixtures for settlement, ignoring those already queued."""
+    with pending_lock:
+        queued = [fixture_id for fixture_id in fixture_ids if fixture_id not in pending]
+        pending.update(queued)
+
+    for fixture_id in queued:
+        executor.submit(settle, fixture_id)
+
+    return queued
+
+
+def sweep() -> List[int]:
+    """Queue the finished fixtures left unsettled."""
+    db = session_local()
+    try:
+        fixture_ids = fixtures.get_unpaid_finished_fixture_ids(db)
+    finally:
+        db.close()
+
+    queued = submit(fixture_ids)
+    if queued:
+        print(f"Settlement sweep queued unsettled fixtures {queued}")
+    return queued
+
+
+async def run():
+    """Sweep for unsettled fixtures until cancelled."""
+    while True:
+        await asyncio.sleep(SETTLEMENT_SWEEP_INTERVAL)
+        try:
+            await asyncio.to_thread(sweep)
+        except SQLAlchemyError as e:
+            print(f"Settlement sweep failed, retrying: {e}")
+
+
+def start():
+    """Start the sweep on the running event loop."""
+    global sweeper  # pylint: disable=global-statement
+    sweeper = asyncio.create_task(run())
+
+
+async def stop():
+    """Stop the sweep."""
+    global sweeper  # pylint: disable=global-statement
+    if sweeper is not None:
+        sweeper.cancel()
+        try:
+            await sweeper
+        except asyncio.CancelledError:
+            pass
+    sweeper = None
+
+
+def shutdown():
+    """Wait for queued settlements to finish."""
+    executor.shutdown(wait=True)
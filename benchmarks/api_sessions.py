@@ -0,0 +1,204 @@
+"""Database connections held by each API request.
+
+Runs the API in process against a temporary SQLite database and counts, per
+request, the sessions that began a transaction, the pooled connections checked
+out of both engines, the most held at once and the ones still checked out once
+the response was sent. Every endpoint and its dependencies share one session,
+so no request should use more than one session, hold more than one connection
+at a time or leave one behind:
+
+    python benchmarks/api_sessions.py
+
+Exits with status 1 when a request does. The connection goes back to the pool
+on commit, so a request that commits and reads again checks out again.
+"""
+
+import argparse
+import contextvars
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+POST_TOKEN = "benchmark"
+HEADERS = {"Authorization": f"Bearer {POST_TOKEN}"}
+
+# Counters of the request being served, copied into its tasks and threads
+current: contextvars.ContextVar = contextvars.ContextVar("current", default=None)
+
+# Counters of every request served, in order
+served: list = []
+
+
+class Counter:
+    def __init__(self):
+        self.sessions: set = set()
+        self.checkouts = 0
+        self.held = 0
+        self.peak = 0
+
+
+def checkout(*_):
+    counter = current.get()
+    if counter is not None:
+        counter.checkouts += 1
+        counter.held += 1
+        counter.peak = max(counter.peak, counter.held)
+
+
+def checkin(*_):
+    counter = current.get()
+    if counter is not None:
+        counter.held -= 1
+
+
+def begin(session, *_):
+    counter = current.get()
+    if counter is not None:
+        counter.sessions.add(id(session))
+
+
+def counted(app):
+    """Wrap an ASGI app to count the connections of each HTTP request."""
+
+    async def wrapper(scope, receive, send):
+        if scope["type"] != "http":
+            await app(scope, receive, send)
+            return
+        served.append(Counter())
+        token = current.set(served[-1])
+        try:
+            await app(scope, receive, send)
+        finally:
+            current.reset(token)
+
+    return wrapper
+
+
+def requests(fixture):
+    """The requests to measure, as method, path and keyword arguments."""
+    purchase = {"uid": "buyer", "fixture_id": 1, "quantity": 1, "result": "Home 1"}
+    return [
+        ("POST", "/fixtures/", {"json": fixture(1), "headers": HEADERS}),
+        ("GET", "/fixtures/", {}),
+        ("GET", "/fixtures/1", {}),
+        ("GET", "/fixtures/available", {}),
+        ("POST", "/users/signup", {"json": {"uid": "buyer", "email": "b@b.cl", "admin": False}}),
+        ("PATCH", "/users/wallet", {"json": {"uid": "buyer", "amount": 10000}}),
+        ("GET", "/users/wallet/buyer", {}),
+        ("POST", "/requests/wallet", {"json": purchase}),
+        ("POST", "/requests/wallet", {"json": {**purchase, "quantity": 100}}),
+        ("POST", "/requests/wallet", {"json": {**purchase, "fixture_id": 2}}),
+        ("POST", "/requests/reserved", {"json": purchase}),
+        ("POST", "/requests/reserved", {"json": {**purchase, "quantity": 100}}),
+        (
+            "POST",
+            "/requests/",
+            {
+                "json": {
+                    "request_id": str(uuid.uuid4()),
+                    "group_id": 1,
+                    "fixture_id": 1,
+                    "league_name": "Liga",
+                    "round": "Regular Season - 1",
+                    "date": "2030-01-01T00:00:00",
+                    "result": "Home 1",
+                    "datetime": "2030-01-01T00:00:00",
+                    "quantity": 1,
+                },
+                "headers": HEADERS,
+            },
+        ),
+        ("GET", "/users/wallet/buyer/history", {}),
+        ("GET", "/discounts/", {}),
+        ("GET", "/auctions/offers", {"params": {"user_id": "buyer"}}),
+    ]
+
+
+def run():
+    # pylint: disable=import-outside-toplevel
+    sys.path[:0] = [os.path.join(ROOT, "api"), ROOT]
+    from db import migrate
+
+    migrate.upgrade()
+
+    from api_purchases import fixture
+    from app.main import app
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event, update
+    from sqlalchemy.orm import Session
+
+    from db import models
+    from db.async_database import async_engine
+    from db.database import engine, session_local
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    for pool_engine in (engine, async_engine.sync_engine):
+        event.listen(pool_engine, "checkout", checkout)
+        event.listen(pool_engine, "checkin", checkin)
+    event.listen(Session, "after_begin", begin)
+
+    failed = False
+    with TestClient(counted(app)) as client:
+        for number, (method, path, kwargs) in enumerate(requests(fixture)):
+            if number == 1:
+                # Bets to sell as reserved
+                with session_local() as db:
+                    db.execute(update(models.FixtureModel).values(reserved_home=5))
+                    db.commit()
+
+            response = client.request(method, path, **kwargs)
+            counter = served[-1]
+            ok = len(counter.sessions) <= 1 and counter.peak <= 1 and counter.held == 0
+            failed |= not ok
+            print(
+                f"{method:<6} {path:<32} {response.status_code}"
+                f"  sessions {len(counter.sessions)}  checkouts {counter.checkouts}  peak {counter.peak}"
+                f"  left {counter.held}  {'ok' if ok else 'FAIL'}"
+            )
+    sys.exit(1 if failed else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run()
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {
+            **os.environ,
+            "ENV": "production",
+            "DATABASE_URL": f"sqlite:///{workdir}/sessions.db",
+            "POST_TOKEN": POST_TOKEN,
+            "PATH_FIXTURES": "fixtures",
+            "PATH_REQUESTS": "requests",
+            "PATH_USERS": "users",
+            "PATH_AUCTIONS": "auctions",
+            "PATH_DISCOUNTS": "discounts",
+            "BET_PRICE": "1000",
+            "BET_LIMMIT": "1000",
+            "GROUP_ID": "2",
+            "SESSION_ID": "benchmark",
+            "TRANSBANK_REDIRECT_URL": "http://localhost",
+            "EMAIL": "benchmark@example.com",
+            "EMAIL_PASSWORD": "benchmark",
+            "PUBLISHER_HOST": "127.0.0.1",
+            "PUBLISHER_PORT": "1",
+            "JOBS_MASTER_HOST": "127.0.0.1",
+            "JOBS_MASTER_PORT": "1",
+        }
+        result = subprocess.run([sys.executable, __file__, "--run"], env=env, check=False)
+        sys.exit(result.returncode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Fixture broadcasts per second through the API and in direct database mode.
+
+Each mode runs in its own process against a fresh SQLite database:
+
+- http: the listener callbacks post to a local uvicorn serving the fixtures
+  router.
+- direct: LISTENER_MODE=direct, and the callbacks call the crud layer
+  themselves.
+
+    python benchmarks/listener_direct.py --messages 50 --fixtures 40
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def fixture(fixture_id: int, sequence: int) -> dict:
+    odds = random.Random(fixture_id * 1000 + sequence)
+    return {
+        "fixture": {
+            "id": fixture_id,
+            "referee": "Referee",
+            "timezone": "UTC",
+            "date": "2024-11-01T00:00:00+00:00",
+            "timestamp": 1730419200,
+            "status": {"long": "Not Started", "short": "NS", "elapsed": None},
+        },
+        "league": {
+            "id": 1,
+            "name": "Liga",
+            "country": "Chile",
+            "logo": "logo",
+            "flag": "flag",
+            "season": 2024,
+            "round": "Regular Season - 1",
+        },
+        "teams": {
+            "home": {
+                "id": fixture_id * 2,
+                "name": f"Home {fixture_id}",
+                "logo": "logo",
+            },
+            "away": {
+                "id": fixture_id * 2 + 1,
+                "name": f"Away {fixture_id}",
+                "logo": "logo",
+            },
+        },
+        "goals": {"home": None, "away": None},
+        "odds": [
+            {
+                "id": 1,
+                "name": "Match Winner",
+                "values": [
+                    {"value": value, "odd": f"{odds.uniform(1, 5):.2f}"}
+                    for value in ("Home", "Draw", "Away")
+                ],
+            }
+        ],
+    }
+
+
+def history(fixture_id: int, sequence: int) -> dict:
+    update = fixture(fixture_id, sequence)
+    update["fixture"]["status"] = {"long": "Second Half", "short": "2H", "elapsed": 60}
+    update["goals"] = {"home": sequence % 4, "away": sequence % 3}
+    return {"fixture": update["fixture"], "goals": update["goals"]}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_api(port: int):
+    """Serve the fixtures router with uvicorn in a background thread."""
+    import uvicorn  # pylint: disable=import-outside-toplevel
+    from app.routers import fixtures  # pylint: disable=import-outside-toplevel
+    from fastapi import FastAPI  # pylint: disable=import-outside-toplevel
+
+    app = FastAPI()
+    app.include_router(fixtures.router)
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+
+def run_mode(args):
+    """Benchmark one mode, the environment is already set by the parent."""
+    sys.path[:0] = [os.path.join(ROOT, "listener"), os.path.join(ROOT, "api"), ROOT]
+    from db import migrate  # pylint: disable=import-outside-toplevel
+
+    migrate.upgrade()
+    if os.environ["LISTENER_MODE"] == "http":
+        start_api(int(os.environ["API_PORT"]))
+
+    import callbacks  # pylint: disable=import-outside-toplevel
+
+    info = [
+        {"fixtures": [fixture(m * args.fixtures + f, m) for f in range(args.fixtures)]}
+        for m in range(args.messages)
+    ]
+    updates = [
+        {"fixtures": [history(m * args.fixtures + f, m) for f in range(args.fixtures)]}
+        for m in range(args.messages)
+    ]
+
+    async def main():
+        start = time.perf_counter()
+        for payload in info:
+            await callbacks.on_info(payload)
+        info_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for payload in updates:
+            await callbacks.on_history(payload)
+            await callbacks.history.flush()
+        history_elapsed = time.perf_counter() - start
+
+        await callbacks.close()
+        return info_elapsed, history_elapsed
+
+    info_elapsed, history_elapsed = asyncio.run(main())
+    print(
+        f"{os.environ['LISTENER_MODE']:<7}"
+        f" info: {args.messages / info_elapsed:7.1f} msg/s"
+        f" ({args.messages * args.fixtures / info_elapsed:8.1f} fixtures/s)"
+        f"   history: {args.messages / history_elapsed:7.1f} msg/s"
+        f" ({args.messages * args.fixtures / history_elapsed:8.1f} fixtures/s)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--fixtures", type=int, default=40)
+    parser.add_argument("--mode", choices=["http", "direct"])
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args)
+        return
+
+    print(f"{args.messages} messages of {args.fixtures} fixtures")
+    for mode in ("http", "direct"):
+        with tempfile.TemporaryDirectory() as workdir:
+            env = {
+                **os.environ,
+                "ENV": "production",
+                "LISTENER_MODE": mode,
+                "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+                "SPOOL_PATH": f"{workdir}/spool.db",
+                "API_HOST": "127.0.0.1",
+                "API_PORT": str(free_port()),
+                "POST_TOKEN": "benchmark",
+                "PATH_FIXTURES": "fixtures",
+                "PATH_REQUESTS": "requests",
+                "PATH_AUCTIONS": "auctions",
+                "BET_PRICE": "1000",
+                "GROUP_ID": "2",
+            }
+            subprocess.run(
+                [sys.executable, __file__, "--mode", mode, *sys.argv[1:]],
+                env=env,
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
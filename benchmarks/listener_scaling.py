@@ -0,0 +1,176 @@
+"""Checks that N listeners split the broker traffic without duplicates.
+
+Needs a broker, e.g. the Mosquitto service of compose.dev.yaml:
+
+    docker compose -f compose.dev.yaml --profile local-broker up -d mqtt-broker
+    python benchmarks/listener_scaling.py --listeners 2
+
+Each simulated listener subscribes like listener/main.py does, applies the
+same partition filter and hands the messages to its own dispatcher lanes. The
+script publishes every request immediately followed by its validation, and a
+few history broadcasts, then reports who handled what. Exits with status 1
+when a message is lost or handled twice, a fixture is owned by more than one
+listener, or a validation is handled before its request.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import paho.mqtt.client as mqtt
+import paho.mqtt.enums as mqtt_enums
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "listener"))
+
+from dispatcher import Dispatcher  # noqa: E402
+from partitions import owned  # noqa: E402
+
+TOPICS = [
+    "fixtures/info",
+    "fixtures/history",
+    "fixtures/requests",
+    "fixtures/validation",
+]
+
+
+def cancel_workers(dispatcher: Dispatcher):
+    async def cancel():
+        for worker in dispatcher.workers:
+            worker.cancel()
+        await asyncio.gather(*dispatcher.workers, return_exceptions=True)
+
+    return cancel
+
+
+def start_listener(args, index: int, handled: dict, lock: threading.Lock):
+    def record(topic: str):
+        async def callback(payload):
+            with lock:
+                if topic == "fixtures/history":
+                    for match in payload["fixtures"]:
+                        handled[topic].append(
+                            (index, match["fixture"]["id"], match["sequence"])
+                        )
+                else:
+                    handled[topic].append((index, payload["request_id"]))
+                    handled["purchases"].append(
+                        (index, payload["request_id"], topic)
+                    )
+
+        return callback
+
+    dispatcher = Dispatcher({topic: record(topic) for topic in TOPICS})
+
+    def on_connect(client, userdata, flags, reason_code, properties):
+        client.subscribe([(topic, 1) for topic in TOPICS])
+
+    def on_message(client, userdata, msg):
+        payload = owned(msg.topic, json.loads(msg.payload), index, args.listeners)
+        if payload is not None:
+            dispatcher.dispatch(msg.topic, payload)
+
+    client = mqtt.Client(mqtt_enums.CallbackAPIVersion.VERSION2)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(args.host, args.port, 60)
+    client.loop_start()
+    return client, dispatcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("MQTT_HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MQTT_PORT", "1883")))
+    parser.add_argument("--listeners", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--fixtures", type=int, default=200)
+    parser.add_argument("--updates", type=int, default=3)
+    args = parser.parse_args()
+
+    handled = defaultdict(list)
+    lock = threading.Lock()
+    listeners = [
+        start_listener(args, index, handled, lock) for index in range(args.listeners)
+    ]
+    time.sleep(1)
+
+    publisher = mqtt.Client(mqtt_enums.CallbackAPIVersion.VERSION2)
+    publisher.connect(args.host, args.port, 60)
+    publisher.loop_start()
+
+    request_ids = [str(uuid.uuid4()) for _ in range(args.requests)]
+    for request_id in request_ids:
+        publisher.publish(
+            "fixtures/requests", json.dumps({"request_id": request_id}), qos=1
+        )
+        publisher.publish(
+            "fixtures/validation",
+            json.dumps({"request_id": request_id, "valid": True}),
+            qos=1,
+        )
+    for sequence in range(args.updates):
+        fixtures = [
+            {"fixture": {"id": fixture_id}, "sequence": sequence}
+            for fixture_id in range(args.fixtures)
+        ]
+        publisher.publish(
+            "fixtures/history", json.dumps({"fixtures": fixtures}), qos=1
+        ).wait_for_publish()
+    time.sleep(2)
+
+    publisher.loop_stop()
+    publisher.disconnect()
+    for client, dispatcher in listeners:
+        client.loop_stop()
+        client.disconnect()
+        dispatcher.stop(cancel_workers(dispatcher))
+
+    failed = False
+    for topic in ("fixtures/requests", "fixtures/validation"):
+        counts = Counter(request_id for _, request_id in handled[topic])
+        per_listener = Counter(index for index, _ in handled[topic])
+        duplicates = sum(count > 1 for count in counts.values())
+        failed |= len(counts) != args.requests or duplicates > 0
+        print(f"{topic} handled: {len(counts)}/{args.requests}")
+        print(f"{topic} handled more than once: {duplicates}")
+        print(f"{topic} per listener: {dict(sorted(per_listener.items()))}")
+
+    events = defaultdict(list)
+    for index, request_id, topic in handled["purchases"]:
+        events[request_id].append((index, topic))
+    expected = ["fixtures/requests", "fixtures/validation"]
+    out_of_order = sum(
+        [topic for _, topic in handling] != expected
+        or len({index for index, _ in handling}) > 1
+        for handling in events.values()
+    )
+    failed |= out_of_order > 0
+    print(f"validations not after their request on its listener: {out_of_order}")
+
+    owners = defaultdict(set)
+    sequences = defaultdict(list)
+    for index, fixture_id, sequence in handled["fixtures/history"]:
+        owners[fixture_id].add(index)
+        sequences[fixture_id].append(sequence)
+    in_order = all(s == list(range(args.updates)) for s in sequences.values())
+    shared = sum(len(o) > 1 for o in owners.values())
+    failed |= len(owners) != args.fixtures or shared > 0 or not in_order
+    print(f"fixtures handled: {len(owners)}/{args.fixtures}")
+    print(f"fixtures owned by more than one listener: {shared}")
+    print(f"fixture updates in order: {in_order}")
+    print(
+        "fixtures per listener: "
+        f"{dict(sorted(Counter(next(iter(o)) for o in owners.values()).items()))}"
+    )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Listener throughput against a local stub API.
+
+Compares the old serial path (one blocking ``requests`` call per message, new
+TCP connection each time) with the pooled, concurrent callbacks of the listener.
+
+    python benchmarks/listener_throughput.py --messages 500 --latency 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StubAPI(BaseHTTPRequestHandler):
+    """Answers every request after a fixed latency, like a busy API would."""
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def handle_request(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        time.sleep(self.latency)
+        status = 200 if self.command == "PATCH" else 201
+        body = json.dumps({"inserted": 0, "updated": 0, "skipped": 0}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = handle_request
+    do_PATCH = handle_request
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def start_stub(latency: float) -> ThreadingHTTPServer:
+    StubAPI.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAPI)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def request_payload(i: int) -> dict:
+    return {
+        "request_id": f"00000000-0000-0000-0000-{i:012d}",
+        "group_id": 1,
+        "fixture_id": 1,
+        "league_name": "Liga",
+        "round": "Regular Season - 1",
+        "date": "2024-11-01T00:00:00",
+        "result": "---",
+        "datetime": "2024-11-01T00:00:00 UTC",
+        "quantity": 1,
+    }
+
+
+def run_serial(url: str, messages: int) -> float:
+    import requests  # pylint: disable=import-outside-toplevel
+
+    start = time.perf_counter()
+    for i in range(messages):
+        requests.post(url, json=request_payload(i), timeout=30)
+    return time.perf_counter() - start
+
+
+def run_concurrent(callbacks, messages: int) -> float:
+    async def main():
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(callbacks.on_requests(request_payload(i)) for i in range(messages))
+        )
+        elapsed = time.perf_counter() - start
+        await callbacks.close()
+        return elapsed
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    server = start_stub(args.latency)
+    host, port = server.server_address
+
+    os.environ.update(
+        API_HOST=host,
+        API_PORT=str(port),
+        POST_TOKEN="benchmark",
+        PATH_FIXTURES="fixtures",
+        PATH_REQUESTS="requests",
+        PATH_AUCTIONS="auctions",
+        REQUESTS_CONCURRENCY=str(args.concurrency),
+    )
+    sys.path.insert(0, os.path.join(ROOT, "listener"))
+    import callbacks  # pylint: disable=import-outside-toplevel
+
+    serial = run_serial(f"http://{host}:{port}/requests/", args.messages)
+    concurrent = run_concurrent(callbacks, args.messages)
+
+    print(f"messages: {args.messages}, API latency: {args.latency * 1000:.0f} ms")
+    print(f"serial:     {serial:7.2f} s  {args.messages / serial:8.1f} msg/s")
+    print(f"concurrent: {concurrent:7.2f} s  {args.messages / concurrent:8.1f} msg/s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
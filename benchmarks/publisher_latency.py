@@ -0,0 +1,107 @@
+"""Publish latency of a connection per message against the persistent broker client.
+
+    python benchmarks/publisher_latency.py --host localhost --port 1883 --messages 500
+
+Reports how long the caller is blocked per message, and how long it takes
+until a subscriber has received every message.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+import paho.mqtt.enums as mqtt_enums
+import paho.mqtt.publish as publish
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "publisher"))
+
+from broker import Broker  # noqa: E402 pylint: disable=wrong-import-position
+
+TOPIC = "benchmarks/publisher"
+
+
+class Subscriber:
+    """Counts the benchmark messages the broker delivers."""
+
+    def __init__(self, host: str, port: int):
+        self.received = 0
+        self.done = threading.Event()
+        self.expected = 0
+        self.subscribed = threading.Event()
+        self.client = mqtt.Client(mqtt_enums.CallbackAPIVersion.VERSION2)
+        self.client.on_connect = lambda client, *_: client.subscribe(TOPIC)
+        self.client.on_subscribe = lambda *_: self.subscribed.set()
+        self.client.on_message = self.on_message
+        self.client.connect(host, port, 60)
+        self.client.loop_start()
+        self.subscribed.wait(5)
+
+    def on_message(self, client, userdata, msg):
+        self.received += 1
+        if self.received >= self.expected:
+            self.done.set()
+
+    def expect(self, count: int):
+        self.received = 0
+        self.expected = count
+        self.done.clear()
+
+
+def report(name: str, latencies: list, delivered: float):
+    latencies = sorted(latencies)
+    print(
+        f"{name:<11} p50 {1000 * statistics.median(latencies):8.3f} ms"
+        f"  p99 {1000 * latencies[int(len(latencies) * 0.99) - 1]:8.3f} ms"
+        f"  all delivered after {delivered:6.2f} s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("MQTT_HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MQTT_PORT", "1883")))
+    parser.add_argument("--user", default=os.getenv("MQTT_USER"))
+    parser.add_argument("--password", default=os.getenv("MQTT_PASSWORD"))
+    parser.add_argument("--messages", type=int, default=500)
+    args = parser.parse_args()
+
+    subscriber = Subscriber(args.host, args.port)
+    auth = {"username": args.user, "password": args.password} if args.user else None
+
+    subscriber.expect(args.messages)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(args.messages):
+        sent = time.perf_counter()
+        publish.single(
+            TOPIC, payload=str(i), hostname=args.host, port=args.port, auth=auth
+        )
+        latencies.append(time.perf_counter() - sent)
+    subscriber.done.wait(60)
+    report("single", latencies, time.perf_counter() - start)
+
+    broker = Broker(args.host, args.port, args.user, args.password)
+    broker.start()
+    broker.connected.wait(5)
+
+    subscriber.expect(args.messages)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(args.messages):
+        sent = time.perf_counter()
+        broker.publish(TOPIC, str(i))
+        latencies.append(time.perf_counter() - sent)
+    subscriber.done.wait(60)
+    report("persistent", latencies, time.perf_counter() - start)
+
+    broker.stop()
+    subscriber.client.loop_stop()
+
+
+if __name__ == "__main__":
+    main()
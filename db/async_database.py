@@ -0,0 +1,40 @@
+"""Asyncio database engine for the API.
+
+Uses the same DATABASE_URL as db/database.py with an asyncio driver, asyncpg
+for Postgres and aiosqlite for SQLite, so queries from ``async def`` endpoints
+wait without blocking the event loop. The synchronous engine stays for
+migrations, settlements and the listener's direct mode.
+"""
+
+import os
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from db.database import DATABASE_URL
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_url(url: str) -> str:
+    """Swap the driver of a database URL for its asyncio counterpart."""
+    parsed = make_url(url)
+    return parsed.set(
+        drivername=ASYNC_DRIVERS.get(parsed.get_backend_name(), parsed.drivername)
+    ).render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_url(str(DATABASE_URL))
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_size=10, max_overflow=20)
+
+# Objects stay usable after commit, lazy loads are not possible outside a query
+async_session_local = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+async def get_async_db():
+    """Get an async database session."""
+    async with async_session_local() as db:
+        yield db
@@ -0,0 +1,48 @@
+"""Apply pending database migrations.
+
+Run once per deploy (``python -m db.migrate``) before starting the API, instead
+of creating tables at import time. Concurrent runs from several replicas are
+serialized with a Postgres advisory lock, so only the first one applies DDL.
+"""
+
+import logging
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, text
+
+from db.database import engine
+
+logging.basicConfig(level=logging.INFO)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), "alembic.ini")
+
+# Schema created by ``Base.metadata.create_all`` before migrations existed
+BASELINE_REVISION = "0001"
+
+# Arbitrary key shared by every process that migrates the database
+MIGRATION_LOCK_KEY = 217301
+
+
+def upgrade(revision: str = "head"):
+    """Upgrade the database to the given revision."""
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(
+                text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY}
+            )
+
+        config = Config(ALEMBIC_INI)
+        config.attributes["connection"] = connection
+
+        tables = inspect(connection).get_table_names()
+        if "alembic_version" not in tables and "fixtures" in tables:
+            logging.info("Stamping existing schema as revision %s", BASELINE_REVISION)
+            command.stamp(config, BASELINE_REVISION)
+
+        command.upgrade(config, revision)
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,45 @@
+"""Alembic environment for the shared database schema."""
+
+from logging.config import fileConfig
+
+from alembic import context
+
+from db import models
+from db.database import engine
+
+config = context.config
+
+if config.config_file_name is not None and config.attributes.get("connection") is None:
+    fileConfig(config.config_file_name)
+
+target_metadata = models.Base.metadata
+
+
+def run_migrations(connection):
+    """Run the migrations on an open connection."""
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    """Run migrations against DATABASE_URL, reusing a connection when given one."""
+    connection = config.attributes.get("connection")
+
+    if connection is not None:
+        run_migrations(connection)
+        return
+
+    with engine.connect() as connection:
+        run_migrations(connection)
+
+
+if context.is_offline_mode():
+    raise RuntimeError("Offline migrations are not supported")
+
+run_migrations_online()
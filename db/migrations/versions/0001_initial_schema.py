@@ -0,0 +1,207 @@
+"""Initial schema
+
+Revision ID: 0001
+Revises:
+
+Schema as it was created by ``Base.metadata.create_all`` before migrations.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "leagues",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=255), nullable=True),
+        sa.Column("country", sa.String(length=255), nullable=True),
+        sa.Column("logo_url", sa.String(length=255), nullable=True),
+        sa.Column("flag_url", sa.String(length=255), nullable=True),
+        sa.Column("season", sa.Integer(), nullable=True),
+        sa.Column("round", sa.String(length=255), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_leagues_id"), "leagues", ["id"])
+
+    op.create_table(
+        "teams",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=255), nullable=True),
+        sa.Column("logo_url", sa.String(length=255), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_teams_id"), "teams", ["id"])
+
+    op.create_table(
+        "users",
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("email", sa.String(length=255), nullable=True),
+        sa.Column("wallet", sa.Float(), nullable=True),
+        sa.Column("job_id", sa.String(length=255), nullable=True),
+        sa.Column("admin", sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_users_id"), "users", ["id"])
+    op.create_index(op.f("ix_users_email"), "users", ["email"], unique=True)
+
+    op.create_table(
+        "fixtures",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("referee", sa.String(length=255), nullable=True),
+        sa.Column("timezone", sa.String(length=255), nullable=True),
+        sa.Column("date", sa.DateTime(), nullable=True),
+        sa.Column("timestamp", sa.Integer(), nullable=True),
+        sa.Column("status_long", sa.String(length=255), nullable=True),
+        sa.Column("status_short", sa.String(length=255), nullable=True),
+        sa.Column("status_elapsed", sa.Integer(), nullable=True),
+        sa.Column("id_league", sa.Integer(), nullable=True),
+        sa.Column("id_home_team", sa.Integer(), nullable=True),
+        sa.Column("id_away_team", sa.Integer(), nullable=True),
+        sa.Column("remaining_bets", sa.Integer(), nullable=True),
+        sa.Column("reserved_home", sa.Integer(), nullable=True),
+        sa.Column("reserved_away", sa.Integer(), nullable=True),
+        sa.Column("reserved_draw", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["id_away_team"], ["teams.id"]),
+        sa.ForeignKeyConstraint(["id_home_team"], ["teams.id"]),
+        sa.ForeignKeyConstraint(["id_league"], ["leagues.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_fixtures_id"), "fixtures", ["id"])
+
+    op.create_table(
+        "fixture_teams",
+        sa.Column("id_fixture", sa.Integer(), nullable=False),
+        sa.Column("id_team", sa.Integer(), nullable=False),
+        sa.Column("goals", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["id_fixture"], ["fixtures.id"]),
+        sa.ForeignKeyConstraint(["id_team"], ["teams.id"]),
+        sa.PrimaryKeyConstraint("id_fixture", "id_team"),
+    )
+
+    op.create_table(
+        "odds",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("id_fixture", sa.Integer(), nullable=True),
+        sa.Column("name", sa.String(length=255), nullable=True),
+        sa.ForeignKeyConstraint(["id_fixture"], ["fixtures.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_odds_id"), "odds", ["id"])
+
+    op.create_table(
+        "odd_values",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("id_odd", sa.Integer(), nullable=True),
+        sa.Column("value", sa.Float(), nullable=True),
+        sa.Column("bet", sa.String(length=255), nullable=True),
+        sa.ForeignKeyConstraint(["id_odd"], ["odds.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_odd_values_id"), "odd_values", ["id"])
+
+    op.create_table(
+        "requests",
+        sa.Column("request_id", sa.String(length=255), nullable=False),
+        sa.Column("group_id", sa.Integer(), nullable=True),
+        sa.Column("fixture_id", sa.Integer(), nullable=True),
+        sa.Column("league_name", sa.String(length=255), nullable=True),
+        sa.Column("round", sa.String(length=255), nullable=True),
+        sa.Column("date", sa.DateTime(), nullable=True),
+        sa.Column("result", sa.String(length=255), nullable=True),
+        sa.Column("deposit_token", sa.String(length=255), nullable=True),
+        sa.Column("datetime", sa.String(length=255), nullable=True),
+        sa.Column("quantity", sa.Integer(), nullable=True),
+        sa.Column("wallet", sa.Boolean(), nullable=False),
+        sa.Column("seller", sa.Integer(), nullable=True),
+        sa.Column(
+            "status",
+            sa.Enum("PENDING", "APPROVED", "REJECTED", name="requeststatusenum"),
+            nullable=True,
+        ),
+        sa.Column("user_id", sa.String(), nullable=True),
+        sa.Column("url_boleta", sa.String(length=255), nullable=True),
+        sa.Column("paid", sa.Boolean(), nullable=True),
+        sa.Column("correct", sa.Boolean(), nullable=True),
+        sa.Column("location", sa.String(length=255), nullable=True),
+        sa.ForeignKeyConstraint(["fixture_id"], ["fixtures.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("request_id"),
+    )
+    op.create_index(op.f("ix_requests_request_id"), "requests", ["request_id"])
+
+    op.create_table(
+        "transactions",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("token", sa.String(length=255), nullable=True),
+        sa.Column("request_id", sa.String(length=255), nullable=True),
+        sa.Column("fixture_id", sa.Integer(), nullable=True),
+        sa.Column("user_id", sa.String(), nullable=True),
+        sa.Column("result", sa.String(length=255), nullable=True),
+        sa.Column("quantity", sa.Integer(), nullable=True),
+        sa.Column("status", sa.String(length=255), nullable=True),
+        sa.Column("wallet", sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_transactions_id"), "transactions", ["id"])
+
+    op.create_table(
+        "offers",
+        sa.Column("auction_id", sa.String(), nullable=False),
+        sa.Column("fixture_id", sa.Integer(), nullable=True),
+        sa.Column("league_name", sa.String(length=255), nullable=True),
+        sa.Column("round", sa.String(length=255), nullable=True),
+        sa.Column("result", sa.String(length=255), nullable=True),
+        sa.Column("quantity", sa.Integer(), nullable=True),
+        sa.Column("group_id", sa.Integer(), nullable=True),
+        sa.Column("status", sa.String(length=255), nullable=True),
+        sa.ForeignKeyConstraint(["fixture_id"], ["fixtures.id"]),
+        sa.PrimaryKeyConstraint("auction_id"),
+    )
+    op.create_index(op.f("ix_offers_auction_id"), "offers", ["auction_id"])
+
+    op.create_table(
+        "proposals",
+        sa.Column("auction_id", sa.String(), nullable=True),
+        sa.Column("proposal_id", sa.String(), nullable=False),
+        sa.Column("fixture_id", sa.Integer(), nullable=True),
+        sa.Column("league_name", sa.String(length=255), nullable=True),
+        sa.Column("round", sa.String(length=255), nullable=True),
+        sa.Column("result", sa.String(length=255), nullable=True),
+        sa.Column("quantity", sa.Integer(), nullable=True),
+        sa.Column("group_id", sa.Integer(), nullable=True),
+        sa.Column("status", sa.String(length=255), nullable=True),
+        sa.ForeignKeyConstraint(["auction_id"], ["offers.auction_id"]),
+        sa.ForeignKeyConstraint(["fixture_id"], ["fixtures.id"]),
+        sa.PrimaryKeyConstraint("proposal_id"),
+    )
+    op.create_index(op.f("ix_proposals_proposal_id"), "proposals", ["proposal_id"])
+
+    op.create_table(
+        "discounts",
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("discount", sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_discounts_id"), "discounts", ["id"])
+
+
+def downgrade():
+    op.drop_table("discounts")
+    op.drop_table("proposals")
+    op.drop_table("offers")
+    op.drop_table("transactions")
+    op.drop_table("requests")
+    sa.Enum(name="requeststatusenum").drop(op.get_bind(), checkfirst=True)
+    op.drop_table("odd_values")
+    op.drop_table("odds")
+    op.drop_table("fixture_teams")
+    op.drop_table("fixtures")
+    op.drop_table("users")
+    op.drop_table("teams")
+    op.drop_table("leagues")
@@ -0,0 +1,103 @@
+"""Natural key constraints and secondary indexes
+
+Revision ID: 0002
+Revises: 0001
+
+Duplicated odds and odd values left by concurrent listeners are merged into the
+oldest row before the unique constraints are added, so the positional order of
+odds and values is preserved.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+NATURAL_KEYS = (
+    ("odds", "uq_odds_fixture_name", ["id_fixture", "name"]),
+    ("odd_values", "uq_odd_values_odd_bet", ["id_odd", "bet"]),
+)
+
+
+def upgrade():
+    op.execute(
+        """
+        UPDATE odd_values SET id_odd = (
+            SELECT MIN(kept.id) FROM odds AS duplicate
+            JOIN odds AS kept
+                ON kept.id_fixture = duplicate.id_fixture AND kept.name = duplicate.name
+            WHERE duplicate.id = odd_values.id_odd
+        )
+        WHERE id_odd IN (
+            SELECT duplicate.id FROM odds AS duplicate
+            WHERE EXISTS (
+                SELECT 1 FROM odds AS kept
+                WHERE kept.id_fixture = duplicate.id_fixture
+                AND kept.name = duplicate.name
+                AND kept.id < duplicate.id
+            )
+        )
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM odd_values WHERE EXISTS (
+            SELECT 1 FROM odd_values AS kept
+            WHERE kept.id_odd = odd_values.id_odd
+            AND kept.bet = odd_values.bet
+            AND kept.id < odd_values.id
+        )
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM odds WHERE EXISTS (
+            SELECT 1 FROM odds AS kept
+            WHERE kept.id_fixture = odds.id_fixture
+            AND kept.name = odds.name
+            AND kept.id < odds.id
+        )
+        """
+    )
+
+    inspector = sa.inspect(op.get_bind())
+    for table, name, columns in NATURAL_KEYS:
+        # Tables created by create_all already have the constraint, the ones
+        # the API altered at startup have a unique index of the same name
+        if name in {key["name"] for key in inspector.get_unique_constraints(table)}:
+            continue
+        if name in {index["name"] for index in inspector.get_indexes(table)}:
+            op.drop_index(name, table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.create_unique_constraint(name, columns)
+
+    op.create_index(op.f("ix_fixtures_status_short"), "fixtures", ["status_short"])
+    op.create_index(op.f("ix_fixtures_id_home_team"), "fixtures", ["id_home_team"])
+    op.create_index(op.f("ix_fixtures_id_away_team"), "fixtures", ["id_away_team"])
+    op.create_index(op.f("ix_fixture_teams_id_team"), "fixture_teams", ["id_team"])
+    op.create_index(op.f("ix_requests_user_id"), "requests", ["user_id"])
+    op.create_index(
+        "ix_requests_fixture_id_status", "requests", ["fixture_id", "status"]
+    )
+    op.create_index(op.f("ix_transactions_token"), "transactions", ["token"])
+    op.create_index(op.f("ix_proposals_auction_id"), "proposals", ["auction_id"])
+
+
+def downgrade():
+    op.drop_index(op.f("ix_proposals_auction_id"), table_name="proposals")
+    op.drop_index(op.f("ix_transactions_token"), table_name="transactions")
+    op.drop_index("ix_requests_fixture_id_status", table_name="requests")
+    op.drop_index(op.f("ix_requests_user_id"), table_name="requests")
+    op.drop_index(op.f("ix_fixture_teams_id_team"), table_name="fixture_teams")
+    op.drop_index(op.f("ix_fixtures_id_away_team"), table_name="fixtures")
+    op.drop_index(op.f("ix_fixtures_id_home_team"), table_name="fixtures")
+    op.drop_index(op.f("ix_fixtures_status_short"), table_name="fixtures")
+
+    with op.batch_alter_table("odd_values") as batch_op:
+        batch_op.drop_constraint("uq_odd_values_odd_bet", type_="unique")
+
+    with op.batch_alter_table("odds") as batch_op:
+        batch_op.drop_constraint("uq_odds_fixture_name", type_="unique")
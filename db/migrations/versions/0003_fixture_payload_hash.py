@@ -0,0 +1,24 @@
+"""Fixture payload hash
+
+Revision ID: 0003
+Revises: 0002
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "fixtures", sa.Column("payload_hash", sa.String(length=64), nullable=True)
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("fixtures") as batch_op:
+        batch_op.drop_column("payload_hash")
@@ -0,0 +1,31 @@
+"""Fixture settlements
+
+Revision ID: 0004
+Revises: 0003
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "settlements",
+        sa.Column("fixture_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "settled_at", sa.DateTime(), server_default=sa.func.now(), nullable=True
+        ),
+        sa.Column("tickets", sa.Integer(), nullable=True),
+        sa.Column("correct", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["fixture_id"], ["fixtures.id"]),
+        sa.PrimaryKeyConstraint("fixture_id"),
+    )
+
+
+def downgrade():
+    op.drop_table("settlements")
@@ -0,0 +1,40 @@
+"""Wallet ledger
+
+Revision ID: 0006
+Revises: 0005
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "wallet_ledger",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("user_id", sa.String(), nullable=False),
+        sa.Column("delta", sa.Float(), nullable=False),
+        sa.Column("reason", sa.String(length=255), nullable=False),
+        sa.Column("fixture_id", sa.Integer(), nullable=True),
+        sa.Column("request_id", sa.String(length=255), nullable=True),
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.func.now(), nullable=True
+        ),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_wallet_ledger_user_id_id", "wallet_ledger", ["user_id", "id"])
+    op.create_index(
+        op.f("ix_wallet_ledger_fixture_id"), "wallet_ledger", ["fixture_id"]
+    )
+
+
+def downgrade():
+    op.drop_index(op.f("ix_wallet_ledger_fixture_id"), table_name="wallet_ledger")
+    op.drop_index("ix_wallet_ledger_user_id_id", table_name="wallet_ledger")
+    op.drop_table("wallet_ledger")
@@ -0,0 +1,24 @@
+"""Requests by user and datetime
+
+Revision ID: 0007
+Revises: 0006
+"""
+
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_requests_user_id_datetime",
+        "requests",
+        ["user_id", "datetime", "request_id"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_requests_user_id_datetime", table_name="requests")
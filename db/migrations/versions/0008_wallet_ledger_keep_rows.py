@@ -0,0 +1,52 @@
+"""Keep the wallet ledger of deleted users
+
+Revision ID: 0008
+Revises: 0007
+
+The ledger is append-only, so deleting a user clears the user_id of its rows
+instead of deleting them.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+FOREIGN_KEY = "fk_wallet_ledger_user_id_users"
+
+
+def upgrade():
+    # SQLite does not name the constraint nor enforce foreign keys here, only
+    # the named Postgres one is replaced
+    names = [
+        key["name"]
+        for key in sa.inspect(op.get_bind()).get_foreign_keys("wallet_ledger")
+        if key["referred_table"] == "users" and key["name"]
+    ]
+    with op.batch_alter_table("wallet_ledger") as batch_op:
+        batch_op.alter_column("user_id", existing_type=sa.String(), nullable=True)
+        for name in names:
+            batch_op.drop_constraint(name, type_="foreignkey")
+        if names:
+            batch_op.create_foreign_key(
+                FOREIGN_KEY, "users", ["user_id"], ["id"], ondelete="SET NULL"
+            )
+
+
+def downgrade():
+    op.execute("DELETE FROM wallet_ledger WHERE user_id IS NULL")
+    names = [
+        key["name"]
+        for key in sa.inspect(op.get_bind()).get_foreign_keys("wallet_ledger")
+        if key["name"] == FOREIGN_KEY
+    ]
+    with op.batch_alter_table("wallet_ledger") as batch_op:
+        for name in names:
+            batch_op.drop_constraint(name, type_="foreignkey")
+            batch_op.create_foreign_key(
+                "wallet_ledger_user_id_fkey", "users", ["user_id"], ["id"]
+            )
+        batch_op.alter_column("user_id", existing_type=sa.String(), nullable=False)
@@ -0,0 +1,34 @@
+"""Inventory flushes
+
+Revision ID: 0009
+Revises: 0008
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "inventory_flushes",
+        sa.Column("token", sa.String(length=36), nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.func.now(), nullable=True
+        ),
+        sa.PrimaryKeyConstraint("token"),
+    )
+    op.create_index(
+        op.f("ix_inventory_flushes_created_at"), "inventory_flushes", ["created_at"]
+    )
+
+
+def downgrade():
+    op.drop_index(
+        op.f("ix_inventory_flushes_created_at"), table_name="inventory_flushes"
+    )
+    op.drop_table("inventory_flushes")
@@ -0,0 +1,26 @@
+"""Outbox ordering key
+
+Revision ID: 0010
+Revises: 0009
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "outbox", sa.Column("ordering_key", sa.String(length=255), nullable=True)
+    )
+    op.create_index("ix_outbox_ordering_key_id", "outbox", ["ordering_key", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_outbox_ordering_key_id", table_name="outbox")
+    with op.batch_alter_table("outbox") as batch_op:
+        batch_op.drop_column("ordering_key")
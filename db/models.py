@@ -6,8 +6,9 @@ from enum import Enum as PyEnum
 
 from sqlalchemy import Boolean, Column, DateTime
 from sqlalchemy import Enum as SqlEnum
-from sqlalchemy import Float, ForeignKey, Integer, String
+from sqlalchemy import Float, ForeignKey, Index, Integer, String, Text, UniqueConstraint
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
 
 from .database import Base
 
@@ -31,20 +32,26 @@ class FixtureModel(Base):
     date = Column(DateTime)
     timestamp = Column(Integer)
     status_long = Column(String(255))
-    status_short = Column(String(255))
+    status_short = Column(String(255), index=True)
     status_elapsed = Column(Integer, nullable=True)
     id_league = Column(Integer, ForeignKey("leagues.id"))
-    id_home_team = Column(Integer, ForeignKey("teams.id"))
-    id_away_team = Column(Integer, ForeignKey("teams.id"))
+    id_home_team = Column(Integer, ForeignKey("teams.id"), index=True)
+    id_away_team = Column(Integer, ForeignKey("teams.id"), index=True)
 
     remaining_bets = Column(Integer, default=BET_LIMMIT)
     reserved_home = Column(Integer, default=0)
     reserved_away = Column(Integer, default=0)
     reserved_draw = Column(Integer, default=0)
 
+    # Hash of the last fixtures/info payload applied, to skip unchanged re-broadcasts
+    payload_hash = Column(String(64), nullable=True)
+
     league = relationship("LeagueModel", back_populates="fixtures")
     odds = relationship(
-        "OddModel", back_populates="fixture", cascade="all, delete-orphan"
+        "OddModel",
+        back_populates="fixture",
+        cascade="all, delete-orphan",
+        order_by="OddModel.id",
     )
     requests = relationship("RequestModel", back_populates="fixture")
 
@@ -100,7 +107,7 @@ class FixtureTeamModel(Base):
     __tablename__ = "fixture_teams"
 
     id_fixture = Column(Integer, ForeignKey("fixtures.id"), primary_key=True)
-    id_team = Column(Integer, ForeignKey("teams.id"), primary_key=True)
+    id_team = Column(Integer, ForeignKey("teams.id"), primary_key=True, index=True)
     goals = Column(Integer, nullable=True)
 
     team = relationship("TeamModel", back_populates="fixture_teams")
@@ -112,6 +119,7 @@ class OddValueModel(Base):
     """Base class for odd values"""
 
     __tablename__ = "odd_values"
+    __table_args__ = (UniqueConstraint("id_odd", "bet", name="uq_odd_values_odd_bet"),)
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     id_odd = Column(Integer, ForeignKey("odds.id"))
@@ -125,6 +133,7 @@ class OddModel(Base):
     """Base class for odds"""
 
     __tablename__ = "odds"
+    __table_args__ = (UniqueConstraint("id_fixture", "name", name="uq_odds_fixture_name"),)
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     id_fixture = Column(Integer, ForeignKey("fixtures.id"))
@@ -132,7 +141,10 @@ class OddModel(Base):
 
     fixture = relationship("FixtureModel", back_populates="odds")
     values = relationship(
-        "OddValueModel", back_populates="odds", cascade="all, delete-orphan"
+        "OddValueModel",
+        back_populates="odds",
+        cascade="all, delete-orphan",
+        order_by="OddValueModel.id",
     )
 
 
@@ -160,6 +172,10 @@ class RequestModel(Base):
     """Base class for requests"""
 
     __tablename__ = "requests"
+    __table_args__ = (
+        Index("ix_requests_fixture_id_status", "fixture_id", "status"),
+        Index("ix_requests_user_id_datetime", "user_id", "datetime", "request_id"),
+    )
 
     request_id = Column(String(255), primary_key=True, index=True)
     group_id = Column(Integer)
@@ -175,7 +191,9 @@ class RequestModel(Base):
     seller = Column(Integer, nullable=True)
 
     status = Column(SqlEnum(RequestStatusEnum), default=RequestStatusEnum.PENDING)
-    user_id = Column(String, ForeignKey("users.id"), nullable=True, default=None)
+    user_id = Column(
+        String, ForeignKey("users.id"), nullable=True, default=None, index=True
+    )
     url_boleta = Column(String(255), nullable=True)
 
     paid = Column(Boolean, default=False)
@@ -188,13 +206,66 @@ class RequestModel(Base):
     user = relationship("UserModel", back_populates="requests")
 
 
+class SettlementModel(Base):
+    """Base class for fixture settlements"""
+
+    __tablename__ = "settlements"
+
+    fixture_id = Column(Integer, ForeignKey("fixtures.id"), primary_key=True)
+    settled_at = Column(DateTime, server_default=func.now())
+    tickets = Column(Integer, default=0)
+    correct = Column(Integer, default=0)
+
+
+class OutboxModel(Base):
+    """Base class for broker messages waiting to be published"""
+
+    __tablename__ = "outbox"
+    __table_args__ = (Index("ix_outbox_ordering_key_id", "ordering_key", "id"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    topic = Column(String(255), nullable=False)
+    payload = Column(Text, nullable=False)
+    # Messages with the same key are published in id order, one at a time
+    ordering_key = Column(String(255), nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    attempts = Column(Integer, default=0, nullable=False)
+    error = Column(String(255), nullable=True)
+    rejected = Column(Boolean, default=False, nullable=False)
+
+
+class WalletLedgerModel(Base):
+    """Base class for wallet changes, the users' wallet is their running total"""
+
+    __tablename__ = "wallet_ledger"
+    __table_args__ = (Index("ix_wallet_ledger_user_id_id", "user_id", "id"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Cleared when the user is deleted, the ledger keeps its rows
+    user_id = Column(String, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    delta = Column(Float, nullable=False)
+    reason = Column(String(255), nullable=False)
+    fixture_id = Column(Integer, nullable=True, index=True)
+    request_id = Column(String(255), nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+
+class InventoryFlushModel(Base):
+    """Base class for inventory deltas written from Redis, one row per batch"""
+
+    __tablename__ = "inventory_flushes"
+
+    token = Column(String(36), primary_key=True)
+    created_at = Column(DateTime, server_default=func.now(), index=True)
+
+
 class TransactionModel(Base):
     """Base class for transactions"""
 
     __tablename__ = "transactions"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    token = Column(String(255), nullable=True)
+    token = Column(String(255), nullable=True, index=True)
     request_id = Column(String(255))
     fixture_id = Column(Integer)
     user_id = Column(String)
@@ -224,7 +295,7 @@ class ProposalModel(Base):
 
     __tablename__ = "proposals"
 
-    auction_id = Column(String, ForeignKey("offers.auction_id"))
+    auction_id = Column(String, ForeignKey("offers.auction_id"), index=True)
     proposal_id = Column(String, primary_key=True, index=True)
     fixture_id = Column(Integer, ForeignKey("fixtures.id"))
     league_name = Column(String(255))
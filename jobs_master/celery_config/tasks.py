@@ -11,9 +11,7 @@ if os.getenv("ENV") != "production":
 from typing import Dict, List
 
 from db import models
-from db.database import engine, get_db
-
-models.Base.metadata.create_all(bind=engine)
+from db.database import get_db
 
 
 def db():
@@ -1,8 +1,10 @@
+import asyncio
 import logging
 import os
 import sys
 
-import requests
+import httpx
+from spool import Spool
 
 API_HOST = os.getenv("API_HOST")
 API_PORT = os.getenv("API_PORT")
@@ -35,105 +37,352 @@ else:
     logging.error("API_PORT environment variable not set or not an integer")
     sys.exit(1)
 
+API_URL = f"http://{API_HOST}:{API_PORT}"
 
-def on_info(payload):
+# "http" sends fixture broadcasts to the API, "direct" writes them to the database
+LISTENER_MODE = os.getenv("LISTENER_MODE", "http")
+
+if LISTENER_MODE == "direct":
+    import direct
+elif LISTENER_MODE != "http":
+    logging.error("LISTENER_MODE must be http or direct")
+    sys.exit(1)
+
+# Connections kept open to the API, shared by every topic
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+
+# Fixtures per bulk request when a broadcast is split
+FIXTURES_CHUNK_SIZE = int(os.getenv("FIXTURES_CHUNK_SIZE", "100"))
+
+# Seconds history updates are held to keep only the latest per fixture, 0 sends
+# every update as it arrives
+HISTORY_COALESCE_WINDOW = float(os.getenv("HISTORY_COALESCE_WINDOW", "1"))
+
+# Requests in flight to the API per topic
+CONCURRENCY = {
+    "fixtures/info": int(os.getenv("INFO_CONCURRENCY", "4")),
+    "fixtures/history": int(os.getenv("HISTORY_CONCURRENCY", "4")),
+    "fixtures/requests": int(os.getenv("REQUESTS_CONCURRENCY", "16")),
+    "fixtures/validation": int(os.getenv("VALIDATION_CONCURRENCY", "16")),
+    "fixtures/auctions": int(os.getenv("AUCTIONS_CONCURRENCY", "8")),
+}
+
+semaphores = {topic: asyncio.Semaphore(limit) for topic, limit in CONCURRENCY.items()}
+
+client = httpx.AsyncClient(
+    base_url=API_URL,
+    headers={"Authorization": f"Bearer {POST_TOKEN}"},
+    timeout=httpx.Timeout(30, connect=5),
+    limits=httpx.Limits(
+        max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE
+    ),
+)
+
+
+async def send(topic: str, method: str, path: str, payload) -> httpx.Response:
+    """Send a payload to the API within the concurrency limit of its topic."""
+    async with semaphores[topic]:
+        return await client.request(method, path, json=payload)
+
+
+async def write_fixtures(topic: str, chunk: list) -> dict | None:
+    """Store a chunk of fixtures through the API, or in the database directly."""
+    if LISTENER_MODE == "direct":
+        write = (
+            direct.upsert_fixtures
+            if topic == "fixtures/info"
+            else direct.update_fixtures_history
+        )
+        async with semaphores[topic]:
+            try:
+                return await asyncio.to_thread(write, chunk)
+            except Exception as e:  # pylint: disable=broad-except
+                logging.error("Error writing matches: %s", str(e))
+                return None
+
+    if topic == "fixtures/info":
+        response = await send(topic, "POST", f"/{PATH_FIXTURES}/bulk", chunk)
+    else:
+        response = await send(topic, "PATCH", f"/{PATH_FIXTURES}/history/bulk", chunk)
+    if response.status_code != 201:
+        logging.error("Failed to store matches: %s", response.text)
+        return None
+    return response.json()
+
+
+def split_fixtures(matches: list) -> list:
+    """Keep the last update of each fixture and split them into bulk chunks."""
+    unique = list({match["fixture"]["id"]: match for match in matches}.values())
+    return [
+        unique[i : i + FIXTURES_CHUNK_SIZE]
+        for i in range(0, len(unique), FIXTURES_CHUNK_SIZE)
+    ]
+
+
+async def on_info(payload):
     """Callback for a message on the info topic."""
-    matches = payload["fixtures"]
-    for i, match in enumerate(matches):
-        logging.info("Processing match %s of %s", str(i + 1), str(len(matches)))
+    try:
+        chunks = split_fixtures(payload["fixtures"])
+    except KeyError as e:
+        logging.error("Invalid info payload: %s", str(e))
+        return
+
+    logging.info("Processing %s matches", str(sum(len(chunk) for chunk in chunks)))
+
+    async def post_chunk(chunk):
         try:
-            response = requests.post(
-                f"http://{API_HOST}:{API_PORT}/{PATH_FIXTURES}",
-                json=match,
-                headers={"Authorization": f"Bearer {POST_TOKEN}"},
-                timeout=5,
+            result = await write_fixtures("fixtures/info", chunk)
+            if result is None:
+                return
+            logging.info(
+                "Matches inserted: %(inserted)s, updated: %(updated)s, skipped: %(skipped)s",
+                result,
             )
-            if response.status_code != 201:
-                logging.error("Failed to post match: %s", response.text)
-        except requests.exceptions.RequestException as e:
-            logging.error("Error posting match: %s", str(e))
+        except httpx.HTTPError as e:
+            logging.error("Error posting matches: %s", str(e))
+
+    await asyncio.gather(*(post_chunk(chunk) for chunk in chunks))
     logging.info("All matches processed")
 
 
-def on_history(payload):
-    """Callback for a message on the history topic."""
-    matches = payload["fixtures"]
-    for i, match in enumerate(matches):
-        logging.info("Processing match %s of %s", str(i + 1), str(len(matches)))
+class HistoryCoalescer:
+    """Keeps the latest history update per fixture and patches them in batches.
+
+    The first update after a flush opens a window of HISTORY_COALESCE_WINDOW
+    seconds; updates for the same fixture within it replace each other, so the
+    API updates and settles each fixture once per window.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self.pending: dict = {}
+        self.received = 0
+        self.coalesced = 0
+        self.flusher: asyncio.Task | None = None
+
+    async def add(self, updates: dict, received: int):
+        """Queue the latest update of each fixture in a history message."""
+        self.pending.update(updates)
+        self.received += received
+
+        if self.window <= 0:
+            await self.flush()
+        elif self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self._flush_after_window())
+
+    async def _flush_after_window(self):
+        # Updates arriving while a batch is being sent wait for the next window
+        while self.pending:
+            await asyncio.sleep(self.window)
+            await self.flush()
+
+    async def flush(self):
+        """Patch every pending update now."""
+        if not self.pending:
+            return
+        matches = list(self.pending.values())
+        self.pending = {}
+        received, self.received = self.received, 0
+        self.coalesced += received - len(matches)
+
+        if received > len(matches):
+            logging.info(
+                "Coalesced %s history updates into %s, %s dropped since start",
+                received,
+                len(matches),
+                self.coalesced,
+            )
+        chunks = split_fixtures(matches)
+        await asyncio.gather(*(self._patch_chunk(chunk) for chunk in chunks))
+        logging.info("All matches processed")
+
+    async def _patch_chunk(self, chunk):
         try:
-            response = requests.patch(
-                f"http://{API_HOST}:{API_PORT}/{PATH_FIXTURES}/{int(match['fixture']['id'])}",
-                json=match,
-                headers={"Authorization": f"Bearer {POST_TOKEN}"},
-                timeout=5,
+            result = await write_fixtures("fixtures/history", chunk)
+            if result is None:
+                return
+            logging.info(
+                "Matches updated: %(updated)s, missing: %(missing)s, settling: %(settling)s",
+                result,
             )
-            if response.status_code != 201:
-                logging.error("Failed to patch match: %s", response.text)
-        except requests.exceptions.RequestException as e:
-            logging.error("Error patching match: %s", str(e))
-        except KeyError as e:
-            logging.error("Error patching match: %s", str(e))
-            logging.error("Match: %s", match)
-    logging.info("All matches processed")
+        except httpx.HTTPError as e:
+            logging.error("Error patching matches: %s", str(e))
 
 
-def on_requests(payload):
-    """Callback for a message on the requests topic."""
-    logging.info("Processing request")
+history = HistoryCoalescer(HISTORY_COALESCE_WINDOW)
+
+
+async def on_history(payload):
+    """Callback for a message on the history topic."""
     try:
-        response = requests.post(
-            f"http://{API_HOST}:{API_PORT}/{PATH_REQUESTS}",
-            json=payload,
-            headers={"Authorization": f"Bearer {POST_TOKEN}"},
-            timeout=5,
-        )
-        if response.status_code != 201:
-            logging.error("Failed to post request: %s", response.text)
-    except requests.exceptions.RequestException as e:
-        logging.error("Error processing requests: %s", str(e))
+        matches = payload["fixtures"]
+        updates = {match["fixture"]["id"]: match for match in matches}
+    except (KeyError, TypeError) as e:
+        logging.error("Invalid history payload: %s", str(e))
+        return
 
+    logging.info("Processing %s matches", str(len(matches)))
+    await history.add(updates, len(matches))
 
-def on_validation(payload):
-    """Callback for a message on the validation topic."""
-    logging.info("Processing validation")
+
+# Status codes worth retrying, any other rejection would fail again
+RETRY_STATUS = {408, 425, 429}
+
+# Longest wait between replays of the spool while the API is down
+SPOOL_MAX_BACKOFF = float(os.getenv("SPOOL_MAX_BACKOFF", "60"))
+
+# Error responses after which a spooled message is parked, so it stops holding
+# back the ones behind it. Connection errors and timeouts are not counted
+SPOOL_MAX_REJECTIONS = int(os.getenv("SPOOL_MAX_REJECTIONS", "10"))
+
+EXPECTED_STATUS = {
+    "fixtures/requests": 201,
+    "fixtures/validation": 200,
+    "fixtures/auctions": 201,
+}
+
+spool = Spool()
+spool_ready = asyncio.Event()
+
+
+def route(topic: str, payload) -> tuple[str, str] | None:
+    """Method and path of the API call for a spooled topic."""
+    if topic == "fixtures/requests":
+        return "POST", f"/{PATH_REQUESTS}/"
+    if topic == "fixtures/validation":
+        return "PATCH", f"/{PATH_REQUESTS}/{payload['request_id']}"
+    if topic == "fixtures/auctions":
+        if payload["type"] == "offer" or payload["type"] == "proposal":
+            return "POST", f"/{PATH_AUCTIONS}/"
+        if payload["type"] == "acceptance" or payload["type"] == "rejection":
+            return "PATCH", f"/{PATH_AUCTIONS}/"
+    return None
+
+
+async def deliver(topic: str, payload) -> tuple[str, bool] | None:
+    """Send a message to the API.
+
+    Returns the error if it should be retried, and whether the API answered
+    with it instead of being unreachable.
+    """
+    try:
+        call = route(topic, payload)
+    except (KeyError, TypeError) as e:
+        logging.error("Invalid %s payload: %s", topic, str(e))
+        return None
+    if call is None:
+        return None
+
+    method, path = call
     try:
-        response = requests.patch(
-            f"http://{API_HOST}:{API_PORT}/{PATH_REQUESTS}/{payload['request_id']}",
-            json=payload,
-            headers={"Authorization": f"Bearer {POST_TOKEN}"},
-            timeout=5,
+        response = await send(topic, method, path, payload)
+    except httpx.HTTPError as e:
+        return f"{type(e).__name__}: {e}", False
+
+    if response.status_code == EXPECTED_STATUS[topic]:
+        return None
+    if response.status_code >= 500 or response.status_code in RETRY_STATUS:
+        return f"{response.status_code}: {response.text}", True
+    logging.error("API rejected %s message: %s", topic, response.text)
+    return None
+
+
+def record_failure(target: Spool, message_id: int, topic: str, failure) -> bool:
+    """Record a failed replay, parking the message once rejected too many times."""
+    error, answered = failure
+    if target.failed(message_id, error, answered) < SPOOL_MAX_REJECTIONS:
+        return False
+    target.park(message_id)
+    logging.error(
+        "Parked %s message %s after %s rejections: %s",
+        topic,
+        message_id,
+        SPOOL_MAX_REJECTIONS,
+        error,
+    )
+    return True
+
+
+async def deliver_or_spool(topic: str, payload):
+    """Deliver a message, spooling it to disk if the API cannot take it now."""
+    if len(spool):
+        # Older messages are still waiting, queue behind them to keep the order
+        spool.append(topic, payload)
+        spool_ready.set()
+        return
+
+    failure = await deliver(topic, payload)
+    if failure:
+        logging.warning("Spooling %s message: %s", topic, failure[0])
+        spool.append(topic, payload, failure[0])
+        spool_ready.set()
+
+
+async def replay_spool():
+    """Deliver spooled messages in order, backing off while the API is down."""
+    backoff = 1.0
+    while True:
+        message = spool.head()
+        if message is None:
+            spool_ready.clear()
+            await spool_ready.wait()
+            continue
+
+        message_id, topic, payload = message
+        failure = await deliver(topic, payload)
+        if failure is None:
+            spool.remove(message_id)
+            backoff = 1.0
+            continue
+
+        if record_failure(spool, message_id, topic, failure):
+            backoff = 1.0
+            continue
+        logging.warning(
+            "Replay failed with %s messages spooled, retrying in %.0f s: %s",
+            len(spool),
+            backoff,
+            failure[0],
         )
-        if response.status_code != 200:
-            logging.error("Failed to post validation: %s", response.text)
-    except requests.exceptions.RequestException as e:
-        logging.error("Error processing validation: %s", str(e))
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, SPOOL_MAX_BACKOFF)
 
 
-def on_auction(payload):
-    """Callback for a message on the auction topic"""
-    try:
+async def drain_spool(target: Spool) -> int:
+    """Deliver spooled messages until the spool is empty or the API fails."""
+    while (message := target.head()) is not None:
+        message_id, topic, payload = message
+        failure = await deliver(topic, payload)
+        if failure:
+            if record_failure(target, message_id, topic, failure):
+                continue
+            logging.error("Stopped draining: %s", failure[0])
+            break
+        target.remove(message_id)
+    return len(target)
 
-        if payload["type"] == "offer" or payload["type"] == "proposal":
 
-            response = requests.post(
-                f"http://{API_HOST}:{API_PORT}/{PATH_AUCTIONS}",
-                json=payload,
-                headers={"Authorization": f"Bearer {POST_TOKEN}"},
-                timeout=5,
-            )
-            if response.status_code != 201:
-                logging.error("Failed to post auction: %s", response.text)
+async def on_requests(payload):
+    """Callback for a message on the requests topic."""
+    logging.info("Processing request")
+    await deliver_or_spool("fixtures/requests", payload)
 
-        elif payload["type"] == "acceptance" or payload["type"] == "rejection":
 
-            response = requests.patch(
-                f"http://{API_HOST}:{API_PORT}/{PATH_AUCTIONS}",
-                json=payload,
-                headers={"Authorization": f"Bearer {POST_TOKEN}"},
-                timeout=5,
-            )
-            if response.status_code != 201:
-                logging.error("Failed to post auction: %s", response.text)
+async def on_validation(payload):
+    """Callback for a message on the validation topic."""
+    logging.info("Processing validation")
+    await deliver_or_spool("fixtures/validation", payload)
+
+
+async def on_auction(payload):
+    """Callback for a message on the auction topic"""
+    await deliver_or_spool("fixtures/auctions", payload)
+
 
-    except requests.exceptions.RequestException as e:
-        logging.error("Error processing auction: %s", str(e))
+async def close():
+    """Send pending history updates, then close the API connections and spool."""
+    await history.flush()
+    await client.aclose()
+    if LISTENER_MODE == "direct":
+        await asyncio.to_thread(direct.close)
+    spool.close()
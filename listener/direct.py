@@ -0,0 +1,70 @@
+"""Writes fixture broadcasts straight to the database.
+
+Used when LISTENER_MODE=direct. The listener validates the payloads with the
+API schemas and calls the same crud functions as the bulk endpoints, on its own
+pooled engine, skipping the HTTP round trip to the API. Requests, validations
+and auctions still go through the API, which notifies websocket clients and
+talks to the publisher and the jobs master.
+"""
+
+import os
+import sys
+from typing import List
+
+# The api package and the db package live next to the listener
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "api")):
+    if path not in sys.path:
+        sys.path.append(path)
+
+# pylint: disable=wrong-import-position
+from app import settlement
+from app.crud import fixtures
+from app.schemas import request_schemas
+from pydantic import TypeAdapter
+
+from db.database import session_local
+
+whole_fixtures = TypeAdapter(List[request_schemas.WholeFixture])
+fixture_updates = TypeAdapter(List[request_schemas.FixtureUpdate])
+
+
+def upsert_fixtures(chunk: list) -> dict:
+    """Same as POST /fixtures/bulk."""
+    batch = whole_fixtures.validate_python(chunk)
+    db = session_local()
+    try:
+        return fixtures.bulk_upsert_fixtures(db, batch)
+    finally:
+        db.close()
+
+
+def update_fixtures_history(chunk: list) -> dict:
+    """Same as PATCH /fixtures/history/bulk, settling finished fixtures here."""
+    batch = fixture_updates.validate_python(chunk)
+    db = session_local()
+    try:
+        db_fixtures = fixtures.bulk_update_fixtures(db, batch)
+
+        updated = {db_fixture.id for db_fixture in db_fixtures}
+        finished = fixtures.get_unsettled_fixture_ids(
+            db,
+            [
+                db_fixture.id
+                for db_fixture in db_fixtures
+                if db_fixture.status_short == "FT"
+            ],
+        )
+    finally:
+        db.close()
+
+    return {
+        "updated": len(updated),
+        "missing": sorted({update.fixture.id for update in batch} - updated),
+        "settling": settlement.submit(finished),
+    }
+
+
+def close():
+    """Wait for settlements started by this listener."""
+    settlement.shutdown()
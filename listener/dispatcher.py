@@ -0,0 +1,256 @@
+"""Hands MQTT messages from paho's network thread to the async callbacks."""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import zlib
+
+# Topics sharing a group of lanes. Purchases gate users waiting on a ticket, so
+# they get their own workers and never wait behind a fixtures broadcast
+GROUPS = {
+    "fixtures/requests": "purchases",
+    "fixtures/validation": "purchases",
+    "fixtures/auctions": "purchases",
+    "fixtures/info": "fixtures",
+    "fixtures/history": "fixtures",
+}
+
+# Workers per group, each one owns a lane
+WORKERS = {
+    "purchases": int(os.getenv("PURCHASE_WORKERS", "8")),
+    "fixtures": int(os.getenv("FIXTURE_WORKERS", "2")),
+}
+
+# Messages waiting per lane before on_message blocks
+LISTENER_QUEUE_SIZE = int(os.getenv("LISTENER_QUEUE_SIZE", "500"))
+
+# Seconds between lane stats in the log, 0 turns them off
+LISTENER_STATS_INTERVAL = float(os.getenv("LISTENER_STATS_INTERVAL", "60"))
+
+# Fraction of a lane that triggers the high-watermark warning
+HIGH_WATERMARK = 0.8
+LOW_WATERMARK = 0.5
+
+
+# Broadcasts carrying a batch of fixtures, split between the lanes by fixture
+BROADCAST_TOPICS = {"fixtures/info", "fixtures/history"}
+
+
+def ordering_key(topic: str, payload) -> str:
+    """Messages with the same key are handled in the order they arrived.
+
+    A request and its validation share the request_id and the events of an
+    auction share the auction_id. Broadcasts are keyed by fixture id in
+    ``split``, so the info and history updates of a fixture share a lane.
+    """
+    if isinstance(payload, dict):
+        if topic in ("fixtures/requests", "fixtures/validation"):
+            return str(payload.get("request_id", topic))
+        if topic == "fixtures/auctions":
+            return str(payload.get("auction_id", topic))
+    return topic
+
+
+def lane_index(key: str, lanes: int) -> int:
+    """Lane of an ordering key, stable across processes and restarts."""
+    return zlib.crc32(key.encode()) % lanes
+
+
+def split(topic: str, payload, lanes: int) -> dict:
+    """Part of a message for each lane index it has to go to.
+
+    The fixtures of a broadcast are grouped by the lane of their id, as
+    ``partitions.partition`` groups them by listener.
+    """
+    if topic in BROADCAST_TOPICS:
+        parts: dict = {}
+        try:
+            for match in payload["fixtures"]:
+                index = lane_index(str(match["fixture"]["id"]), lanes)
+                parts.setdefault(index, []).append(match)
+        except (KeyError, TypeError):
+            # Let the callback report the invalid payload
+            parts = {}
+        if parts:
+            return {
+                index: {**payload, "fixtures": matches}
+                for index, matches in parts.items()
+            }
+    return {lane_index(ordering_key(topic, payload), lanes): payload}
+
+
+class Lane:
+    """Bounded queue drained by one worker, with its depth and wait times."""
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self.queue = asyncio.Queue(maxsize=size)
+        self.above_watermark = False
+        self.processed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, enqueued_at: float):
+        wait = time.perf_counter() - enqueued_at
+        self.processed += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    def check_watermark(self):
+        depth = self.queue.qsize()
+        if not self.above_watermark and depth >= self.size * HIGH_WATERMARK:
+            self.above_watermark = True
+            logging.warning(
+                "Lane %s above high watermark: %s/%s messages queued",
+                self.name,
+                depth,
+                self.size,
+            )
+        elif self.above_watermark and depth <= self.size * LOW_WATERMARK:
+            self.above_watermark = False
+            logging.info("Lane %s drained to %s messages", self.name, depth)
+
+    def stats(self, reset: bool = False) -> dict:
+        """Current depth, plus messages and wait times since the last reset."""
+        stats = {
+            "depth": self.queue.qsize(),
+            "processed": self.processed,
+            "avg_wait_ms": round(1000 * self.wait_total / max(self.processed, 1), 1),
+            "max_wait_ms": round(1000 * self.wait_max, 1),
+        }
+        if reset:
+            self.processed = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+        return stats
+
+
+class Dispatcher:
+    """Bounded lanes between paho and the callbacks.
+
+    Every topic belongs to a group with its own workers. Within a group a
+    message goes to the lane of its ordering key and each lane is drained by a
+    single worker, so related messages keep their order while unrelated ones
+    run concurrently. When a lane is full ``dispatch`` blocks, which stops paho
+    from reading the socket until the workers catch up.
+    """
+
+    def __init__(
+        self,
+        callbacks: dict,
+        workers: dict = None,
+        queue_size: int = LISTENER_QUEUE_SIZE,
+    ):
+        self.callbacks = callbacks
+        self.queue_size = queue_size
+        self.loop = asyncio.new_event_loop()
+        self.lanes: dict[str, list[Lane]] = {}
+        self.workers: list[asyncio.Task] = []
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="callbacks", daemon=True
+        )
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(
+            self._start(workers or WORKERS), self.loop
+        ).result()
+
+    async def _start(self, workers: dict):
+        for group, count in workers.items():
+            self.lanes[group] = []
+            for index in range(count):
+                lane = Lane(f"{group}-{index}", self.queue_size)
+                self.lanes[group].append(lane)
+                self.workers.append(self.loop.create_task(self._work(lane)))
+        if LISTENER_STATS_INTERVAL > 0:
+            self.workers.append(self.loop.create_task(self._log_stats()))
+
+    async def _work(self, lane: Lane):
+        while True:
+            topic, payload, enqueued_at = await lane.queue.get()
+            lane.record_wait(enqueued_at)
+            try:
+                await self.callbacks[topic](payload)
+            except Exception as e:  # pylint: disable=broad-except
+                logging.error("Callback for %s failed: %s", topic, str(e))
+            finally:
+                lane.queue.task_done()
+                lane.check_watermark()
+
+    async def _log_stats(self):
+        while True:
+            await asyncio.sleep(LISTENER_STATS_INTERVAL)
+            for group, stats in self.stats(reset=True).items():
+                if stats["depth"] or stats["processed"]:
+                    logging.info("Lanes %s: %s", group, stats)
+
+    async def _put(self, topic: str, payload):
+        lanes = self.lanes[GROUPS[topic]]
+        for index, part in split(topic, payload, len(lanes)).items():
+            await self._put_lane(lanes[index], topic, part)
+
+    async def _put_lane(self, lane: Lane, topic: str, payload):
+        if lane.queue.full():
+            start = time.perf_counter()
+            await lane.queue.put((topic, payload, start))
+            logging.warning(
+                "Lane %s was full, %s waited %.2f s",
+                lane.name,
+                topic,
+                time.perf_counter() - start,
+            )
+        else:
+            lane.queue.put_nowait((topic, payload, time.perf_counter()))
+        lane.check_watermark()
+
+    def dispatch(self, topic: str, payload):
+        """Queue a message from paho's thread, blocking while its lane is full."""
+        asyncio.run_coroutine_threadsafe(self._put(topic, payload), self.loop).result()
+
+    def spawn(self, coroutine):
+        """Run a background coroutine on the callback loop."""
+        self.workers.append(
+            asyncio.run_coroutine_threadsafe(self._task(coroutine), self.loop).result()
+        )
+
+    async def _task(self, coroutine) -> asyncio.Task:
+        return self.loop.create_task(coroutine)
+
+    def stats(self, reset: bool = False) -> dict:
+        """Depth and wait times per group, with the busiest lane of each."""
+        stats = {}
+        for group, lanes in self.lanes.items():
+            per_lane = [lane.stats(reset) for lane in lanes]
+            processed = sum(lane["processed"] for lane in per_lane)
+            stats[group] = {
+                "depth": sum(lane["depth"] for lane in per_lane),
+                "max_lane_depth": max(lane["depth"] for lane in per_lane),
+                "processed": processed,
+                "avg_wait_ms": round(
+                    sum(lane["avg_wait_ms"] * lane["processed"] for lane in per_lane)
+                    / max(processed, 1),
+                    1,
+                ),
+                "max_wait_ms": max(lane["max_wait_ms"] for lane in per_lane),
+            }
+        return stats
+
+    def lane_stats(self) -> dict:
+        """Depth and wait times of every lane."""
+        return {
+            lane.name: lane.stats() for lanes in self.lanes.values() for lane in lanes
+        }
+
+    def depth(self) -> int:
+        """Messages waiting across every lane."""
+        return sum(
+            lane.queue.qsize() for lanes in self.lanes.values() for lane in lanes
+        )
+
+    def stop(self, close=None, timeout: float = 5):
+        """Run the optional ``close`` coroutine and stop the loop."""
+        if close is not None:
+            asyncio.run_coroutine_threadsafe(close(), self.loop).result(timeout=timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
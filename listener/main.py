@@ -15,7 +15,17 @@ import sys
 import paho.mqtt.client as mqtt
 import paho.mqtt.enums as mqtt_enums
 import paho.mqtt.subscribe as subscribe
-from callbacks import on_history, on_info, on_requests, on_validation, on_auction
+from callbacks import (
+    close,
+    on_auction,
+    on_history,
+    on_info,
+    on_requests,
+    on_validation,
+    replay_spool,
+)
+from dispatcher import Dispatcher
+from partitions import owned
 
 logging.basicConfig(level=logging.INFO)
 
@@ -47,6 +57,13 @@ TOPICS = {
     "fixtures/auctions": on_auction,
 }
 
+# Callbacks run on worker lanes in their own thread, so paho's network loop
+# only waits on the API when the lanes are full
+dispatcher = Dispatcher(TOPICS)
+
+# Messages the API could not take are replayed from the spool in the background
+dispatcher.spawn(replay_spool())
+
 
 def on_subscribe(client, userdata, mid, reason_code_list, properties):
     for reason_code in reason_code_list:
@@ -76,7 +93,9 @@ def on_message(client, userdata, msg):
         return
 
     if msg.topic in TOPICS:
-        TOPICS[msg.topic](payload)
+        payload = owned(msg.topic, payload)
+        if payload is not None:
+            dispatcher.dispatch(msg.topic, payload)
     else:
         logging.error("No callback for topic " + msg.topic)
 
@@ -89,4 +108,7 @@ mqttc.on_subscribe = on_subscribe
 mqttc.username_pw_set(USER, PASS)
 mqttc.connect(HOST, PORT, 60)
 
-mqttc.loop_forever()
+try:
+    mqttc.loop_forever()
+finally:
+    dispatcher.stop(close)
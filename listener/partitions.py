@@ -0,0 +1,66 @@
+"""Splits MQTT traffic between several listener processes.
+
+Every listener subscribes to every topic and keeps the messages of its
+partition. Fixture broadcasts are split by fixture id; requests and
+validations by request_id and auction events by auction_id, the keys the
+dispatcher orders them by. A request and its validation are always handled,
+in order, by the same process, which a shared subscription would not ensure.
+"""
+
+import logging
+import os
+import sys
+import zlib
+
+from dispatcher import ordering_key
+
+# Listener processes splitting the traffic and the index of this one
+LISTENER_PARTITIONS = int(os.getenv("LISTENER_PARTITIONS", "1"))
+LISTENER_PARTITION_INDEX = int(os.getenv("LISTENER_PARTITION_INDEX", "0"))
+
+KEYED_TOPICS = {"fixtures/requests", "fixtures/validation", "fixtures/auctions"}
+PARTITIONED_TOPICS = {"fixtures/info", "fixtures/history"}
+
+if LISTENER_PARTITIONS < 1 or not 0 <= LISTENER_PARTITION_INDEX < LISTENER_PARTITIONS:
+    logging.error(
+        "LISTENER_PARTITION_INDEX must be between 0 and LISTENER_PARTITIONS - 1"
+    )
+    sys.exit(1)
+
+
+def partition(key, partitions: int = LISTENER_PARTITIONS) -> int:
+    """Partition of a fixture id or message key, stable across restarts."""
+    return zlib.crc32(str(key).encode()) % partitions
+
+
+def owned(
+    topic: str,
+    payload,
+    index: int = LISTENER_PARTITION_INDEX,
+    partitions: int = LISTENER_PARTITIONS,
+):
+    """Part of a message this listener handles, None if it has nothing to do.
+
+    Fixture broadcasts keep only the fixtures of this partition, purchase
+    messages are kept whole when their key belongs to it.
+    """
+    if partitions == 1:
+        return payload
+    if topic in KEYED_TOPICS:
+        if partition(ordering_key(topic, payload), partitions) == index:
+            return payload
+        return None
+    if topic not in PARTITIONED_TOPICS:
+        return payload
+    try:
+        fixtures = [
+            match
+            for match in payload["fixtures"]
+            if partition(match["fixture"]["id"], partitions) == index
+        ]
+    except (KeyError, TypeError):
+        # Let the callback report the invalid payload
+        return payload
+    if not fixtures:
+        return None
+    return {**payload, "fixtures": fixtures}
@@ -0,0 +1,224 @@
+"""Append-only SQLite spool for messages the API could not take.
+
+Messages the API keeps rejecting are parked in a separate table, so they do
+not hold back the ones behind them. Inspect or drain it from the listener
+directory:
+
+    python spool.py stats
+    python spool.py list --limit 20
+    python spool.py drain
+    python spool.py delete 42
+    python spool.py parked --limit 20
+    python spool.py requeue 42
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import time
+
+SPOOL_PATH = os.getenv("SPOOL_PATH", "spool.db")
+
+
+class Spool:
+    """FIFO of undelivered payloads stored in a SQLite file."""
+
+    def __init__(self, path: str = SPOOL_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                spooled_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+            """)
+        columns = [
+            row[1] for row in self.connection.execute("PRAGMA table_info(messages)")
+        ]
+        if "rejections" not in columns:
+            self.connection.execute(
+                "ALTER TABLE messages ADD COLUMN rejections INTEGER NOT NULL DEFAULT 0"
+            )
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS parked (
+                id INTEGER PRIMARY KEY,
+                topic TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                spooled_at REAL NOT NULL,
+                attempts INTEGER NOT NULL,
+                last_error TEXT,
+                parked_at REAL NOT NULL
+            )
+            """)
+
+    def append(self, topic: str, payload, error: str | None = None) -> int:
+        """Store a message at the end of the spool."""
+        cursor = self.connection.execute(
+            "INSERT INTO messages (topic, payload, spooled_at, last_error) "
+            "VALUES (?, ?, ?, ?)",
+            (topic, json.dumps(payload), time.time(), error),
+        )
+        return cursor.lastrowid
+
+    def head(self) -> tuple[int, str, dict] | None:
+        """Oldest message in the spool."""
+        row = self.connection.execute(
+            "SELECT id, topic, payload FROM messages ORDER BY id LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def remove(self, message_id: int):
+        """Drop a message once it was delivered."""
+        self.connection.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+
+    def failed(self, message_id: int, error: str, rejected: bool = False) -> int:
+        """Record a failed delivery attempt, returning the times the API rejected it.
+
+        ``rejected`` is set when the API answered with an error, as opposed to
+        not answering at all.
+        """
+        self.connection.execute(
+            "UPDATE messages SET attempts = attempts + 1, last_error = ?, "
+            "rejections = rejections + ? WHERE id = ?",
+            (error, int(rejected), message_id),
+        )
+        row = self.connection.execute(
+            "SELECT rejections FROM messages WHERE id = ?", (message_id,)
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+    def park(self, message_id: int):
+        """Move a message out of the way of the ones behind it."""
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.connection.execute(
+                "INSERT INTO parked "
+                "(id, topic, payload, spooled_at, attempts, last_error, parked_at) "
+                "SELECT id, topic, payload, spooled_at, attempts, last_error, ? "
+                "FROM messages WHERE id = ?",
+                (time.time(), message_id),
+            )
+            self.connection.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+        except sqlite3.Error:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def requeue(self, message_id: int) -> int | None:
+        """Append a parked message to the end of the spool again."""
+        row = self.connection.execute(
+            "SELECT topic, payload FROM parked WHERE id = ?", (message_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        new_id = self.append(row[0], json.loads(row[1]))
+        self.connection.execute("DELETE FROM parked WHERE id = ?", (message_id,))
+        return new_id
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Size of the spool per topic and age of the oldest message."""
+        rows = self.connection.execute(
+            "SELECT topic, COUNT(*), MIN(spooled_at) FROM messages GROUP BY topic"
+        ).fetchall()
+        now = time.time()
+        return {
+            topic: {"messages": count, "oldest_seconds": round(now - oldest, 1)}
+            for topic, count, oldest in rows
+        }
+
+    def list(self, limit: int = 20, table: str = "messages") -> list[dict]:
+        """Oldest messages with their delivery attempts."""
+        rows = self.connection.execute(
+            "SELECT id, topic, spooled_at, attempts, last_error, payload "
+            f"FROM {table} ORDER BY id LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [
+            {
+                "id": row[0],
+                "topic": row[1],
+                "spooled_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(row[2])),
+                "attempts": row[3],
+                "last_error": row[4],
+                "payload": json.loads(row[5]),
+            }
+            for row in rows
+        ]
+
+    def parked(self) -> int:
+        """Messages parked after being rejected too many times."""
+        return self.connection.execute("SELECT COUNT(*) FROM parked").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and drain the spool")
+    parser.add_argument("--path", default=SPOOL_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="messages per topic")
+    list_parser = commands.add_parser("list", help="oldest messages")
+    list_parser.add_argument("--limit", type=int, default=20)
+    commands.add_parser("drain", help="deliver every message to the API now")
+    delete_parser = commands.add_parser("delete", help="drop a message by id")
+    delete_parser.add_argument("id", type=int)
+    parked_parser = commands.add_parser("parked", help="oldest parked messages")
+    parked_parser.add_argument("--limit", type=int, default=20)
+    requeue_parser = commands.add_parser(
+        "requeue", help="move a parked message back to the spool"
+    )
+    requeue_parser.add_argument("id", type=int)
+    args = parser.parse_args()
+
+    spool = Spool(args.path)
+
+    if args.command == "stats":
+        stats = {"total": len(spool), "parked": spool.parked(), "topics": spool.stats()}
+        print(json.dumps(stats, indent=2))
+    elif args.command == "list":
+        for message in spool.list(args.limit):
+            print(json.dumps(message))
+    elif args.command == "delete":
+        spool.remove(args.id)
+    elif args.command == "parked":
+        for message in spool.list(args.limit, table="parked"):
+            print(json.dumps(message))
+    elif args.command == "requeue":
+        if spool.requeue(args.id) is None:
+            print(f"No parked message {args.id}")
+    elif args.command == "drain":
+        # Imported here so inspecting the spool does not need the API settings
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        import callbacks  # pylint: disable=import-outside-toplevel
+
+        async def drain():
+            try:
+                return await callbacks.drain_spool(spool)
+            finally:
+                await callbacks.close()
+
+        logging.basicConfig(level=logging.INFO)
+        print(f"{asyncio.run(drain())} messages left in the spool")
+
+    spool.close()
+
+
+if __name__ == "__main__":
+    main()
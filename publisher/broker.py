@@ -0,0 +1,212 @@
+"""Long-lived MQTT connection shared by every request of the publisher."""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+
+import paho.mqtt.client as mqtt
+import paho.mqtt.enums as mqtt_enums
+from spool import Spool
+
+# Messages waiting to be handed to paho before publishes are refused
+PUBLISH_QUEUE_SIZE = int(os.getenv("PUBLISH_QUEUE_SIZE", "10000"))
+
+# QoS of every publish, 1 waits for the broker's PUBACK before forgetting a message
+PUBLISH_QOS = int(os.getenv("PUBLISH_QOS", "1"))
+
+# Messages published but not yet acknowledged by the broker
+PUBLISH_MAX_INFLIGHT = int(os.getenv("PUBLISH_MAX_INFLIGHT", "100"))
+
+
+class TopicMetrics:
+    """Delivery counters of one topic."""
+
+    def __init__(self):
+        self.queued = 0
+        self.acked = 0
+        self.retried = 0
+        self.refused = 0
+        self.ack_total = 0.0
+        self.ack_max = 0.0
+
+    def as_dict(self, inflight: int) -> dict:
+        return {
+            "queued": self.queued,
+            "acked": self.acked,
+            "inflight": inflight,
+            "retried": self.retried,
+            "refused": self.refused,
+            "avg_ack_ms": round(1000 * self.ack_total / max(self.acked, 1), 2),
+            "max_ack_ms": round(1000 * self.ack_max, 2),
+        }
+
+
+class Broker:
+    """Publishes through one persistent client instead of a connection per message.
+
+    paho runs its network loop in a background thread and reconnects on its
+    own. Handlers write each message to the spool and put it on a queue; a
+    sender thread hands it to paho, keeping at most PUBLISH_MAX_INFLIGHT
+    messages waiting for their PUBACK. A message leaves the spool only once the
+    broker acknowledged it, and anything left there is published again on the
+    next start.
+    """
+
+    def __init__(self, host: str, port: int, user: str, password: str):
+        self.host = host
+        self.port = port
+        self.queue: queue.Queue = queue.Queue()
+        self.connected = threading.Event()
+        self.spool = Spool()
+
+        # Published messages by mid until their PUBACK arrives. A slot of the
+        # window is released only when a message leaves inflight, so duplicate
+        # or late acks cannot release it twice
+        self.window = threading.BoundedSemaphore(PUBLISH_MAX_INFLIGHT)
+        self.inflight: dict = {}
+        # Acks of the message _send is publishing, before it recorded the mid
+        self.sending = False
+        self.early_acks: set = set()
+        self.lock = threading.Lock()
+        self.metrics: dict = defaultdict(TopicMetrics)
+
+        self.client = mqtt.Client(mqtt_enums.CallbackAPIVersion.VERSION2)
+        self.client.username_pw_set(user, password)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self.client.max_inflight_messages_set(PUBLISH_MAX_INFLIGHT)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+
+        self.sender = threading.Thread(target=self._send, name="sender", daemon=True)
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            logging.error("Broker refused the connection: %s", str(reason_code))
+            return
+        logging.info("Connected to Broker with result code %s", str(reason_code))
+        self.connected.set()
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self.connected.clear()
+        logging.warning(
+            "Disconnected from Broker with %s messages in flight: %s",
+            len(self.inflight),
+            str(reason_code),
+        )
+
+    def _on_publish(self, client, userdata, mid, reason_code, properties):
+        # Runs on paho's thread, possibly before _send has recorded the mid
+        with self.lock:
+            message = self.inflight.pop(mid, None)
+            if message is None:
+                if self.sending:
+                    self.early_acks.add(mid)
+                else:
+                    logging.debug("Ignoring ack of unknown message %s", mid)
+                return
+        self._acked(*message)
+
+    def _acked(self, message_id: int, topic: str, sent_at: float):
+        self.spool.remove(message_id)
+        self.window.release()
+        elapsed = time.perf_counter() - sent_at
+        with self.lock:
+            metrics = self.metrics[topic]
+            metrics.acked += 1
+            metrics.ack_total += elapsed
+            metrics.ack_max = max(metrics.ack_max, elapsed)
+
+    def _send(self):
+        while True:
+            message = self.queue.get()
+            if message is None:
+                return
+            message_id, topic, payload = message
+            self.window.acquire()
+            with self.lock:
+                self.sending = True
+            while True:
+                self.connected.wait()
+                sent_at = time.perf_counter()
+                info = self.client.publish(topic, payload, qos=PUBLISH_QOS)
+                # With QoS 1 paho keeps the message and resends it on reconnect
+                if info.rc == mqtt.MQTT_ERR_SUCCESS or (
+                    PUBLISH_QOS and info.rc == mqtt.MQTT_ERR_NO_CONN
+                ):
+                    break
+                logging.warning("Retrying publish on %s: %s", topic, str(info.rc))
+                with self.lock:
+                    self.metrics[topic].retried += 1
+                time.sleep(0.5)
+
+            with self.lock:
+                acked = info.mid in self.early_acks
+                # Anything else acked meanwhile was a duplicate
+                self.early_acks.clear()
+                self.sending = False
+                if not acked:
+                    self.inflight[info.mid] = (message_id, topic, sent_at)
+            if acked:
+                self._acked(message_id, topic, sent_at)
+
+    def start(self):
+        """Connect in the background, resend what the last run left unacknowledged."""
+        pending = self.spool.pending()
+        if pending:
+            logging.info("Republishing %s unacknowledged messages", len(pending))
+        for message in pending:
+            self.queue.put(message)
+
+        self.client.connect_async(self.host, self.port, 60)
+        self.client.loop_start()
+        self.sender.start()
+
+    def publish(self, topic: str, payload: str):
+        """Spool and queue a message, raising queue.Full if the broker falls behind."""
+        if self.queue.qsize() >= PUBLISH_QUEUE_SIZE:
+            with self.lock:
+                self.metrics[topic].refused += 1
+            raise queue.Full
+        message_id = self.spool.append(topic, payload)
+        self.queue.put((message_id, topic, payload))
+        with self.lock:
+            self.metrics[topic].queued += 1
+
+    def stats(self) -> dict:
+        """Delivery metrics per topic, plus queue and spool sizes."""
+        with self.lock:
+            inflight = defaultdict(int)
+            for _, topic, _ in self.inflight.values():
+                inflight[topic] += 1
+            topics = {
+                topic: metrics.as_dict(inflight[topic])
+                for topic, metrics in self.metrics.items()
+            }
+        return {
+            "connected": self.connected.is_set(),
+            "queue": self.queue.qsize(),
+            "inflight": sum(inflight.values()),
+            "max_inflight": PUBLISH_MAX_INFLIGHT,
+            "spooled": len(self.spool),
+            "topics": topics,
+        }
+
+    def stop(self, timeout: float = 5):
+        """Send what is already queued and close the connection.
+
+        Messages still unacknowledged stay in the spool for the next start.
+        """
+        self.queue.put(None)
+        self.sender.join(timeout)
+        deadline = time.monotonic() + timeout
+        while self.inflight and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if len(self.spool):
+            logging.warning("%s messages left in the spool", len(self.spool))
+        self.client.disconnect()
+        self.client.loop_stop()
+        self.spool.close()
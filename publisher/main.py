@@ -4,9 +4,12 @@
 
 import logging
 import os
+import queue
 import sys
+from contextlib import asynccontextmanager
+from typing import List
 
-import paho.mqtt.publish as publish
+from broker import Broker
 from fastapi import Depends, FastAPI, HTTPException, Request, status
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
@@ -39,10 +42,19 @@ if not POST_TOKEN:
     sys.exit(1)
 
 
+# Topics the API may publish on through /batch
+TOPICS = {"fixtures/requests", "fixtures/validation", "fixtures/auctions"}
+
+
 class Msg(BaseModel):
     payload: str
 
 
+class TopicMsg(BaseModel):
+    topic: str
+    payload: str
+
+
 def verify_post_token(request: Request):
     """Verify the POST token."""
     token = request.headers.get("Authorization")
@@ -50,7 +62,29 @@ def verify_post_token(request: Request):
         raise HTTPException(status_code=403, detail="Forbidden")
 
 
-app = FastAPI()
+broker = Broker(HOST, PORT, USER, PASS)  # type: ignore
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Keep one MQTT connection open for the lifetime of the process."""
+    broker.start()
+    yield
+    broker.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def enqueue(topic: str, message: str):
+    """Queue a message for the broker, answering 503 if the queue is full."""
+    try:
+        broker.publish(topic, message)
+    except queue.Full:
+        logging.error("Publish queue full, dropping message on %s", topic)
+        return JSONResponse(
+            status_code=503, content={"message": "Failed to publish message"}
+        )
 
 
 @app.get("/")
@@ -59,6 +93,12 @@ async def root():
     return {"message": "Publisher is running"}
 
 
+@app.get("/metrics")
+async def metrics(token: None = Depends(verify_post_token)):
+    """Delivery metrics per topic, in-flight window and retry queue sizes."""
+    return broker.stats()
+
+
 @app.post("/")
 async def publish_message(
     request: Msg,
@@ -66,20 +106,7 @@ async def publish_message(
     token: None = Depends(verify_post_token),
 ):
     """Publish a message to the MQTT broker."""
-    message = request.payload
-    try:
-        publish.single(
-            "fixtures/requests",
-            payload=message,
-            hostname=HOST,  # type: ignore
-            port=PORT,  # type: ignore
-            auth={"username": USER, "password": PASS},  # type: ignore
-        )
-    except Exception as e:
-        logging.error(f"Failed to publish message: {e}")
-        return JSONResponse(
-            status_code=500, content={"message": "Failed to publish message"}
-        )
+    return enqueue("fixtures/requests", request.payload)
 
 
 @app.post("/validate")
@@ -89,20 +116,7 @@ async def publish_validation(
     token: None = Depends(verify_post_token),
 ):
     """Publish a validation to the MQTT broker."""
-    message = request.payload
-    try:
-        publish.single(
-            "fixtures/validation",
-            payload=message,
-            hostname=HOST,  # type: ignore
-            port=PORT,  # type: ignore
-            auth={"username": USER, "password": PASS},  # type: ignore
-        )
-    except Exception as e:
-        logging.error(f"Failed to publish message: {e}")
-        return JSONResponse(
-            status_code=500, content={"message": "Failed to publish message"}
-        )
+    return enqueue("fixtures/validation", request.payload)
 
 
 @app.post("/auction")
@@ -112,17 +126,33 @@ async def publish_auction(
     token: None = Depends(verify_post_token),
 ):
     """Publish an auction to the MQTT broker"""
-    message = request.payload
-    try:
-        publish.single(
-            "fixtures/auctions",
-            payload=message,
-            hostname=HOST,  # type: ignore
-            port=PORT,  # type: ignore
-            auth={"username": USER, "password": PASS},  # type: ignore
-        )
-    except Exception as e:
-        logging.error(f"Failed to publish message: {e}")
-        return JSONResponse(
-            status_code=500, content={"message": "Failed to publish message"}
-        )
+    return enqueue("fixtures/auctions", request.payload)
+
+
+@app.post("/batch")
+async def publish_batch(
+    messages: List[TopicMsg],
+    status_code=status.HTTP_200_OK,
+    token: None = Depends(verify_post_token),
+):
+    """Publish several messages over the persistent connection, in order."""
+    results = []
+    for message in messages:
+        if message.topic not in TOPICS:
+            results.append(
+                {
+                    "topic": message.topic,
+                    "status": "rejected",
+                    "detail": "Unknown topic",
+                }
+            )
+            continue
+        try:
+            broker.publish(message.topic, message.payload)
+            results.append({"topic": message.topic, "status": "queued"})
+        except queue.Full:
+            logging.error("Publish queue full, dropping message on %s", message.topic)
+            results.append(
+                {"topic": message.topic, "status": "failed", "detail": "Queue full"}
+            )
+    return {"results": results}
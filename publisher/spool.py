@@ -0,0 +1,65 @@
+"""SQLite log of messages accepted by the publisher but not yet acknowledged."""
+
+import os
+import sqlite3
+import threading
+import time
+
+PUBLISH_SPOOL_PATH = os.getenv("PUBLISH_SPOOL_PATH", "publish.db")
+
+
+class Spool:
+    """Messages are written before they are queued and removed on PUBACK.
+
+    Whatever is left when the process dies is published again on the next
+    start, so a restart can duplicate a message but never lose one. The API
+    applies a request or validation it already stored only once
+    (``upsert_request`` and ``update_request``).
+    """
+
+    def __init__(self, path: str = PUBLISH_SPOOL_PATH):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        # WAL with synchronous=NORMAL survives a process crash without an fsync
+        # per message, only a power loss can drop the last commits
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                spooled_at REAL NOT NULL
+            )
+            """)
+
+    def append(self, topic: str, payload: str) -> int:
+        with self.lock:
+            return self.connection.execute(
+                "INSERT INTO messages (topic, payload, spooled_at) VALUES (?, ?, ?)",
+                (topic, payload, time.time()),
+            ).lastrowid
+
+    def remove(self, message_id: int):
+        with self.lock:
+            self.connection.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+
+    def pending(self) -> list[tuple[int, str, str]]:
+        """Unacknowledged messages, oldest first."""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT id, topic, payload FROM messages ORDER BY id"
+            ).fetchall()
+
+    def __len__(self) -> int:
+        with self.lock:
+            (count,) = self.connection.execute(
+                "SELECT COUNT(*) FROM messages"
+            ).fetchone()
+            return count
+
+    def close(self):
+        with self.lock:
+            self.connection.close()